@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+"""load_bench.py
+
+Load test of ConferenceApi endpoint methods on the App Engine testbed
+datastore, memcache and taskqueue stubs. Seeds the given volumes of
+profiles, conferences, sessions and speakers, then calls each endpoint
+method directly, as a signed-in user, and reports per call the p50 and p99
+latency, the datastore, memcache and taskqueue RPCs made and the entities
+the datastore returned.
+
+The stubs keep everything in memory, so latencies show the work done per
+call rather than production latencies; the RPC and entity counts carry
+over. Results are written as JSON with the commit they were measured at,
+and a previous results file given as --baseline is compared call by call.
+Run from the repository root with the App Engine SDK on the path:
+
+    python benchmarks/load_bench.py [--conferences N] [--sessions N]
+        [--speakers N] [--profiles N] [--calls N]
+        [--out FILE] [--baseline FILE]
+
+"""
+
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+try:
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+except ImportError:
+    pass
+os.environ.setdefault('APPLICATION_ID', 'bench')
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from models import Conference
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+from models import Profile
+from models import Session
+from models import Speaker
+from models import SpeakerCity
+from models import SpeakerSessions
+
+from conference import CONF_GET_REQUEST
+from conference import ConferenceApi
+from conference import SPEAK_CITY_REQUEST
+
+from seats import createShards
+
+from speakers import directoryEntry
+
+CITIES = ['London', 'Paris', 'Berlin', 'Tokyo', 'Chicago', 'Sydney']
+TOPICS = ['Web', 'Mobile', 'Cloud', 'Data', 'Security', 'Design']
+TYPES = ['Lecture', 'Workshop', 'Keynote', 'Panel', 'Lightning Talk']
+PUT_CHUNK = 500
+AUTH_DOMAIN = 'example.com'
+
+_requestIds = itertools.count(1)
+
+
+class RpcCounter(object):
+    """RpcCounter -- counts the RPCs made through the apiproxy by
+    service.call, and the entities returned by datastore gets and
+    queries"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = collections.Counter()
+        self.entities = 0
+
+    def hook(self, service, call, request, response):
+        """apiproxy post-call hook"""
+        self.calls['%s.%s' % (service, call)] += 1
+        if service == 'datastore_v3':
+            if call == 'Get':
+                self.entities += response.entity_size()
+            elif call in ('RunQuery', 'Next'):
+                self.entities += response.result_size()
+
+
+def setUp():
+    """Activate a testbed with a consistent in-memory datastore, memcache
+    and a task queue that stores tasks without running them."""
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.
+        PseudoRandomHRConsistencyPolicy(probability=1))
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=ROOT)
+    bed.init_urlfetch_stub()
+    return bed
+
+
+def putAll(entities):
+    """Store entities in put_multi chunks of PUT_CHUNK."""
+    for i in range(0, len(entities), PUT_CHUNK):
+        ndb.put_multi(entities[i:i + PUT_CHUNK])
+
+
+def seed(profiles, conferences, sessions, speakers):
+    """Store the given volumes of entities with the derived entities the
+    endpoints read: seat shards, speaker directory entries, speaker tallies
+    and the speaker city index. Returns (profile ids, conference keys)."""
+    p_ids = ['user%d@%s' % (i, AUTH_DOMAIN) for i in range(profiles)]
+    putAll([Profile(key=ndb.Key(Profile, p_id), displayName='User %d' % i,
+                    mainEmail=p_id) for i, p_id in enumerate(p_ids)])
+
+    confs, shards = [], []
+    for i in range(conferences):
+        organizer = p_ids[i % profiles]
+        c_key = ndb.Key(Conference, i + 1,
+                        parent=ndb.Key(Profile, organizer))
+        start = datetime.date(2016, 1 + i % 12, 1 + i % 28)
+        # room for every profile, so registrations never run out of seats
+        confs.append(Conference(
+            key=c_key, name='Conference %d' % i,
+            description='Conference number %d' % i,
+            organizerUserId=organizer,
+            organizerDisplayName='User %d' % (i % profiles),
+            topics=[TOPICS[i % len(TOPICS)], TOPICS[(i + 1) % len(TOPICS)]],
+            city=CITIES[i % len(CITIES)], startDate=start,
+            month=start.month, endDate=start, maxAttendees=profiles))
+        conf_shards = createShards(c_key, profiles)
+        confs[-1].seatShards = len(conf_shards)
+        shards.extend(conf_shards)
+    putAll(confs + shards)
+
+    # speakers are children of the profile that created them, like those
+    # of createSpeaker, so SpeakerForm can give their creatorUserId
+    speaks = []
+    for i in range(speakers):
+        p_key = ndb.Key(Profile, p_ids[i % profiles])
+        speaks.append(Speaker(key=ndb.Key(Speaker, i + 1, parent=p_key),
+                              displayName='Speaker %d' % i))
+    putAll(speaks + [directoryEntry(speak) for speak in speaks])
+
+    sess_list = []
+    tallies = {}
+    cities = {}
+    for i in range(sessions):
+        conf = confs[i % conferences]
+        speak = speaks[i % speakers] if speakers else None
+        sess = Session(
+            key=ndb.Key(Session, i + 1, parent=conf.key),
+            name='Session %d' % i, typeOfSession=TYPES[i % len(TYPES)],
+            duration=60, date=conf.startDate,
+            startTime=datetime.time(8 + i % 14, 0, 0),
+            speakerKey=speak and speak.key)
+        sess_list.append(sess)
+        if not speak:
+            continue
+        t_key = ndb.Key(SpeakerSessions, speak.key.urlsafe(),
+                        parent=conf.key)
+        tally = tallies.setdefault(t_key, SpeakerSessions(
+            key=t_key, speakerKey=speak.key))
+        tally.sessionKeys.append(sess.key)
+        tally.sessionNames.append(sess.name)
+        tally.sessionCount = len(tally.sessionKeys)
+        i_key = ndb.Key(SpeakerCity,
+                        '%s:%s' % (speak.key.urlsafe(), conf.city))
+        index = cities.setdefault(i_key, SpeakerCity(
+            key=i_key, city=conf.city, speakerKey=speak.key))
+        if conf.key not in index.conferenceKeys:
+            index.conferenceKeys.append(conf.key)
+    putAll(sess_list + tallies.values() + cities.values())
+    return p_ids, [conf.key for conf in confs]
+
+
+def signIn(email):
+    """Make the next endpoint call a new request by the given user."""
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = AUTH_DOMAIN
+    os.environ['REQUEST_LOG_ID'] = 'bench-%d' % next(_requestIds)
+    # each request starts with an empty ndb in-context cache
+    ndb.get_context().clear_cache()
+
+
+def percentile(values, p):
+    """Return the nearest-rank p-th percentile of values."""
+    values = sorted(values)
+    return values[max(int(math.ceil(p / 100.0 * len(values))) - 1, 0)]
+
+
+def measure(counter, calls):
+    """Run each (user, callable) in calls as one request and return the
+    latency percentiles in ms and the mean RPCs and entities per call."""
+    latencies = []
+    rpcs = collections.Counter()
+    entities = 0
+    for user, fn in calls:
+        signIn(user)
+        counter.reset()
+        start = time.time()
+        fn()
+        latencies.append((time.time() - start) * 1000)
+        rpcs.update(counter.calls)
+        entities += counter.entities
+    n = float(len(calls))
+    return {
+        'calls': len(calls),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'rpcs': round(sum(rpcs.values()) / n, 2),
+        'rpcs_by_call': dict((name, round(count / n, 2))
+                             for name, count in sorted(rpcs.items())),
+        'entities_read': round(entities / n, 2),
+    }
+
+
+def scenarios(api, p_ids, c_keys, calls):
+    """Return the endpoint calls to measure, by name, as (user, callable)
+    lists; each runs calls times over the seeded data."""
+    def query(i):
+        request = ConferenceQueryForms(filters=[ConferenceQueryForm(
+            field='CITY', operator='EQ', value=CITIES[i % len(CITIES)])])
+        return lambda: api.queryConferences(request)
+
+    def sessions(i):
+        request = CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=c_keys[i % len(c_keys)].urlsafe())
+        return lambda: api.getConferenceSessions(request)
+
+    def register(i):
+        request = CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=c_keys[i % len(c_keys)].urlsafe())
+        return lambda: api.registerForConference(request)
+
+    def byCity(i):
+        request = SPEAK_CITY_REQUEST.combined_message_class(
+            city=CITIES[i % len(CITIES)])
+        return lambda: api.getSpeakerByCity(request)
+
+    user = lambda i: p_ids[i % len(p_ids)]
+    return [
+        ('queryConferences', [(user(i), query(i)) for i in range(calls)]),
+        ('getConferenceSessions',
+         [(user(i), sessions(i)) for i in range(calls)]),
+        # a user registers for a conference at most once
+        ('registerForConference',
+         [(user(i), register(i)) for i in range(min(calls, len(p_ids)))]),
+        ('getSpeakerByCity', [(user(i), byCity(i)) for i in range(calls)]),
+    ]
+
+
+def gitCommit():
+    """Return the commit of the working tree, or None outside git."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print how each call moved against a baseline results file."""
+    before = baseline['results']
+    print '\nagainst %s' % (baseline.get('commit') or 'baseline')
+    for name, stats in sorted(results.items()):
+        if name not in before:
+            continue
+        deltas = []
+        for field in ('p50_ms', 'p99_ms', 'rpcs', 'entities_read'):
+            old, new = before[name][field], stats[field]
+            if old:
+                deltas.append('%s %+.1f%%' % (
+                    field, 100.0 * (new - old) / old))
+            else:
+                deltas.append('%s %+g' % (field, new - old))
+        print '%-24s %s' % (name, '  '.join(deltas))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load test ConferenceApi on the testbed stubs.')
+    parser.add_argument('--profiles', type=int, default=200)
+    parser.add_argument('--conferences', type=int, default=100)
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--speakers', type=int, default=100)
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--out', default='load_bench.json')
+    parser.add_argument('--baseline')
+    args = parser.parse_args(argv)
+
+    bed = setUp()
+    counter = RpcCounter()
+    try:
+        p_ids, c_keys = seed(args.profiles, args.conferences,
+                             args.sessions, args.speakers)
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+            'load_bench', counter.hook)
+        api = ConferenceApi()
+        results = {}
+        print '%d profiles, %d conferences, %d sessions, %d speakers' % (
+            args.profiles, args.conferences, args.sessions, args.speakers)
+        print '%-24s %6s %10s %10s %8s %10s' % (
+            'method', 'calls', 'p50 ms', 'p99 ms', 'rpcs', 'entities')
+        for name, calls in scenarios(api, p_ids, c_keys, args.calls):
+            stats = results[name] = measure(counter, calls)
+            print '%-24s %6d %10.2f %10.2f %8.1f %10.1f' % (
+                name, stats['calls'], stats['p50_ms'], stats['p99_ms'],
+                stats['rpcs'], stats['entities_read'])
+    finally:
+        bed.deactivate()
+
+    with open(args.out, 'w') as f:
+        json.dump({
+            'commit': gitCommit(),
+            'time': datetime.datetime.utcnow().isoformat(),
+            'volumes': {
+                'profiles': args.profiles,
+                'conferences': args.conferences,
+                'sessions': args.sessions,
+                'speakers': args.speakers,
+            },
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print '\nwrote %s' % args.out
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
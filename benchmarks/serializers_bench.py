@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""serializers_bench.py
+
+Micro-benchmark of the precompiled CopyPlan serializers against the
+reflective all_fields()/hasattr/setattr copy they replaced.
+
+Run from the repository root with the App Engine SDK on the path:
+
+    python benchmarks/serializers_bench.py [entities] [repeat]
+
+"""
+
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+try:
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+except ImportError:
+    pass
+os.environ.setdefault('APPLICATION_ID', 'bench')
+
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import Session
+from models import SessionForm
+from models import Speaker
+
+import serializers
+
+
+def reflectiveConferenceCopy(conf, displayName):
+    """The reflective _copyConferenceToForm, kept for comparison."""
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    if displayName:
+        setattr(cf, 'organizerDisplayName', displayName)
+    cf.check_initialized()
+    return cf
+
+
+def reflectiveSessionCopy(sess, related):
+    """The reflective _copySessionToForm, kept for comparison."""
+    sf = SessionForm()
+    for field in sf.all_fields():
+        if hasattr(sess, field.name):
+            if field.name in ('date', 'startTime'):
+                setattr(sf, field.name, str(getattr(sess, field.name)))
+            elif field.name == 'speakerKey':
+                if sess.speakerKey:
+                    setattr(sf, field.name, sess.speakerKey.urlsafe())
+            else:
+                setattr(sf, field.name, getattr(sess, field.name))
+        elif field.name == 'websafeKey':
+            setattr(sf, field.name, sess.key.urlsafe())
+        elif field.name == 'conferenceName':
+            setattr(sf, field.name, related[sess.key.parent()].name)
+        elif field.name == 'speakerName':
+            setattr(sf, field.name,
+                    related[sess.speakerKey].displayName)
+    sf.check_initialized()
+    return sf
+
+
+def makeEntities(count):
+    """Build in-memory conferences, sessions and their related entities."""
+    p_key = ndb.Key(Profile, 'organizer@example.com')
+    speak = Speaker(key=ndb.Key(Speaker, 1, parent=p_key),
+                    displayName='Ada Lovelace')
+    confs, sessions, related = [], [], {speak.key: speak}
+    for i in range(count):
+        conf = Conference(
+            key=ndb.Key(Conference, i + 1, parent=p_key),
+            name='Conference %d' % i, description='A conference',
+            organizerUserId=p_key.id(), topics=['Web', 'Cloud'],
+            city='London', startDate=datetime.date(2015, 6, 1), month=6,
+            endDate=datetime.date(2015, 6, 3), maxAttendees=100,
+            seatsAvailable=50)
+        sess = Session(
+            key=ndb.Key(Session, i + 1, parent=conf.key),
+            name='Session %d' % i, highlights='Highlights',
+            speakerKey=speak.key, typeOfSession='Lecture', duration=60,
+            date=datetime.date(2015, 6, 1),
+            startTime=datetime.time(9, 30))
+        related[conf.key] = conf
+        confs.append(conf)
+        sessions.append(sess)
+    return confs, sessions, related
+
+
+def main(count=1000, repeat=5):
+    confs, sessions, related = makeEntities(count)
+    cases = [
+        ('conference reflective',
+         lambda: [reflectiveConferenceCopy(c, 'Org') for c in confs]),
+        ('conference plan',
+         lambda: [serializers.CONFERENCE_PLAN.copy(c, 'Org') for c in confs]),
+        ('conference plan, no validate',
+         lambda: [serializers.CONFERENCE_PLAN.copy(c, 'Org', False)
+                  for c in confs]),
+        ('session reflective',
+         lambda: [reflectiveSessionCopy(s, related) for s in sessions]),
+        ('session plan',
+         lambda: [serializers.SESSION_PLAN.copy(s, related)
+                  for s in sessions]),
+        ('session plan, no validate',
+         lambda: [serializers.SESSION_PLAN.copy(s, related, False)
+                  for s in sessions]),
+    ]
+    print '%d entities, best of %d' % (count, repeat)
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print '%-32s %8.2f ms  %6.2f us/entity' % (
+            name, best * 1000, best * 1e6 / count)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""sessions_bench.py
+
+Benchmark of getSessionsNotTypeBeforeHour: the datastore-wide type list and
+IN query it used to run, against the single ancestor query on the
+conference with the type excluded while streaming.
+
+Runs on the App Engine testbed datastore stub, which stores entities in
+memory, so the timings show the work done per call rather than production
+latencies. Run from the repository root with the App Engine SDK on the path:
+
+    python benchmarks/sessions_bench.py [sessions] [conferences] [repeat]
+
+"""
+
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+try:
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+except ImportError:
+    pass
+os.environ.setdefault('APPLICATION_ID', 'bench')
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from models import Conference
+from models import Profile
+from models import Session
+
+TYPES = ['Lecture', 'Workshop', 'Keynote', 'Panel', 'Lightning Talk']
+NOT_TYPE = 'Workshop'
+BEFORE = datetime.time(19, 0, 0)
+
+
+def setUp():
+    """Activate a testbed with a consistent in-memory datastore."""
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.
+        PseudoRandomHRConsistencyPolicy(probability=1))
+    bed.init_memcache_stub()
+    ndb.get_context().set_cache_policy(False)
+    return bed
+
+
+def makeSessions(count, conferences):
+    """Store count sessions spread over the given number of conferences;
+    returns the conference keys."""
+    p_key = ndb.Key(Profile, 'organizer@example.com')
+    c_keys = ndb.put_multi([
+        Conference(parent=p_key, name='Conference %d' % i,
+                   organizerUserId=p_key.id())
+        for i in range(conferences)])
+    sessions = [
+        Session(parent=c_keys[i % conferences], name='Session %d' % i,
+                typeOfSession=TYPES[i % len(TYPES)], duration=60,
+                date=datetime.date(2015, 6, 1),
+                startTime=datetime.time(8 + i % 14, 0, 0))
+        for i in range(count)]
+    for i in range(0, count, 500):
+        ndb.put_multi(sessions[i:i + 500])
+    return c_keys
+
+
+def typeListInQuery(c_key):
+    """The former getSessionsNotTypeBeforeHour query, kept for comparison."""
+    notlist = [s.typeOfSession for s in Session.query(
+        Session.typeOfSession != NOT_TYPE).fetch()]
+    return Session.query(Session.typeOfSession.IN(notlist)).filter(
+        Session.conferenceKey == c_key).filter(
+        Session.startTime < BEFORE).fetch()
+
+
+def ancestorStream(c_key):
+    """The ancestor query with the type excluded while streaming."""
+    q = Session.query(ancestor=c_key).filter(
+        Session.startTime < BEFORE).order(Session.startTime)
+    return [s for s in q.iter(batch_size=100)
+            if s.typeOfSession != NOT_TYPE]
+
+
+def main(count=10000, conferences=20, repeat=3):
+    bed = setUp()
+    try:
+        c_key = makeSessions(count, conferences)[0]
+        old, new = typeListInQuery(c_key), ancestorStream(c_key)
+        assert set(s.key for s in old) == set(s.key for s in new)
+        print '%d sessions in %d conferences, %d returned, best of %d' % (
+            count, conferences, len(new), repeat)
+        for name, fn in [('type list + IN query', typeListInQuery),
+                         ('ancestor query, streamed', ancestorStream)]:
+            best = min(timeit.repeat(lambda: fn(c_key), number=1,
+                                     repeat=repeat))
+            print '%-28s %10.2f ms' % (name, best * 1000)
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
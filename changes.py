@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""changes.py
+
+Conference server-side Python App Engine change log in memcache
+
+Publishers append events (seat counts, announcements, featured speakers)
+under consecutive sequence numbers, to the log of their conference, or to
+the global log for events of no one conference. Clients of the /changes
+handler ask for every event after the last sequence numbers they saw of the
+global log and of one conference's log, instead of re-polling the API
+methods; the numbers are passed as one cursor like '12.345'. A busy
+conference only fills its own log, so it never pushes the clients of other
+conferences out of theirs. Events expire after CHANGE_TTL seconds, and a log
+keeps its last CHANGES_MAX events; a client that fell further behind is
+told to reset and refetch what it shows. A publisher takes its number
+before it stores the event, so a number without an event is only treated
+as lost once an event after it is PUBLISH_GRACE seconds old; until then
+readers stop just before it.
+
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+MEMCACHE_CHANGES_SEQ_KEY = 'CHANGES_SEQ:%s'
+MEMCACHE_CHANGE_KEY = 'CHANGE:%s:%d'
+GLOBAL_LOG = 'global'
+CHANGE_TTL = 600
+CHANGES_MAX = 100
+PUBLISH_GRACE = 5
+
+
+def _logs(websafeConferenceKey=None):
+    """Return the names of the logs a client of a conference reads."""
+    if websafeConferenceKey:
+        return [GLOBAL_LOG, websafeConferenceKey]
+    return [GLOBAL_LOG]
+
+
+def publish(kind, data, websafeConferenceKey=None):
+    """Append an event to the change log of its conference, or to the
+    global log; returns its sequence number in that log, or None if
+    memcache is unavailable."""
+    log = websafeConferenceKey or GLOBAL_LOG
+    seq = memcache.incr(MEMCACHE_CHANGES_SEQ_KEY % log, initial_value=0)
+    if seq is None:
+        return None
+    memcache.set(MEMCACHE_CHANGE_KEY % (log, seq), {
+        'id': seq,
+        'kind': kind,
+        'websafeConferenceKey': websafeConferenceKey,
+        'data': data,
+        'time': time.time(),
+    }, time=CHANGE_TTL)
+    return seq
+
+
+def latest(websafeConferenceKey=None):
+    """Return the cursor of the latest events of the global log and, if
+    given, of a conference's log."""
+    logs = _logs(websafeConferenceKey)
+    found = memcache.get_multi([MEMCACHE_CHANGES_SEQ_KEY % log
+                                for log in logs])
+    return [found.get(MEMCACHE_CHANGES_SEQ_KEY % log) or 0 for log in logs]
+
+
+def formatCursor(cursor):
+    """Return a cursor as text, eg '12.345'."""
+    return '.'.join(str(seq) for seq in cursor)
+
+
+def parseCursor(text, websafeConferenceKey=None):
+    """Return the cursor given as text by a client of a conference, or
+    None if it is missing or not one of its cursors."""
+    try:
+        cursor = [int(seq) for seq in text.split('.')]
+    except (AttributeError, ValueError):
+        return None
+    if len(cursor) != len(_logs(websafeConferenceKey)):
+        return None
+    return cursor
+
+
+def read(since, websafeConferenceKey=None):
+    """Return the events after cursor since of the global log and,
+    optionally, of one conference's log, oldest first.
+        Returns:    (events, last, complete); last is the cursor to read
+                    from next, complete is False if events were lost and
+                    the client should reset
+    """
+    logs = _logs(websafeConferenceKey)
+    last = latest(websafeConferenceKey)
+    spans = []
+    for log, after, seq in zip(logs, since, last):
+        if after > seq:
+            # the counter was evicted; sequence numbers restarted
+            return [], last, False
+        first = max(after + 1, seq - CHANGES_MAX + 1)
+        spans.append((log, after, range(first, seq + 1)))
+    found = memcache.get_multi([MEMCACHE_CHANGE_KEY % (log, seq)
+                                for log, _, seqs in spans for seq in seqs])
+    events = []
+    complete = True
+    cursor = []
+    for log, after, seqs in spans:
+        logEvents, logLast, logComplete = _readLog(log, after, seqs, found)
+        events.extend(logEvents)
+        cursor.append(logLast)
+        complete = complete and logComplete
+    events.sort(key=lambda event: event.get('time', 0))
+    return events, cursor, complete
+
+
+def _readLog(log, after, seqs, found):
+    """Return (events, last, complete) of one log from the events found,
+    after sequence number after; seqs are the numbers read."""
+    complete = not seqs or seqs[0] == after + 1
+    # settled[i]: an event after seqs[i] was published over PUBLISH_GRACE
+    # seconds ago, so a missing seqs[i] is not still being published
+    settled = []
+    oldest = time.time() - PUBLISH_GRACE
+    seen = False
+    for seq in reversed(seqs):
+        settled.append(seen)
+        event = found.get(MEMCACHE_CHANGE_KEY % (log, seq))
+        seen = seen or (event is not None and event.get('time', 0) < oldest)
+    settled.reverse()
+    events = []
+    for seq, done in zip(seqs, settled):
+        event = found.get(MEMCACHE_CHANGE_KEY % (log, seq))
+        if event is None:
+            if not done:
+                # probably still being published; read it next time
+                return events, seq - 1, complete
+            # expired, evicted or lost
+            complete = False
+        else:
+            events.append(event)
+    return events, seqs[-1] if seqs else after, complete
@@ -12,11 +12,15 @@ import re
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
 from google.appengine.ext import ndb
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 
 import logging
 
@@ -25,24 +29,91 @@ from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
 from models import TeeShirtSize
+from models import Attendance
+from models import AttendeeForms
 from models import Conference
+from models import FeaturedSpeaker
+from models import GroupBooking
+from models import LowSeats
 from models import ConferenceForm
 from models import ConferenceForms
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
+from models import RegistrationForm
+from models import SearchResultForm
+from models import SearchResultForms
+from models import RegistrationResultForm
+from models import RegistrationResultForms
+from models import SeatShard
 from models import Session
 from models import SessionForm
 from models import SessionForms
 from models import Speaker
 from models import SpeakerForm
+from models import SpeakerCity
+from models import SpeakerName
 from models import SpeakerForms
+from models import SpeakerSessions
+from models import WishlistEntry
 from models import BooleanMessage
 from models import ConflictException
 from models import StringMessage
 
+import changes
+
+from memberships import attendanceKey
+from memberships import attendeeKeysAsync
+from memberships import conferenceKeysToAttendAsync
+from memberships import fromProfile
+from memberships import groupBookerKeysAsync
+from memberships import groupBookingKey
+from memberships import sessionWishlistKeysAsync
+from memberships import wishlistKey
+
+from planner import Predicate
+from planner import QueryPlanner
+from planner import loadIndexes
+
+from seats import adjustSeats
+from seats import createShards
+from seats import openShardKeys
+from seats import openShardKeysMulti
+from seats import randomShardKey
+from seats import seatsAvailable
+from seats import seatsAvailableMulti
+from seats import seatsAvailableMultiAsync
+from seats import takeSeats
+
+from speakers import NAME_MAX_BYTES
+from speakers import directoryEntry
+from speakers import directoryKey
+from speakers import forgetPrefixes
+from speakers import normalizeName
+from speakers import speakersByName
+from speakers import speakersByNameAsync
+from speakers import suggest
+from speakers import validName
+
+from textindex import indexDocuments
+from textindex import search
+
+from serializers import ATTENDEE_PLAN
+from serializers import CONFERENCE_PLAN
+from serializers import PROFILE_PLAN
+from serializers import SESSION_PLAN
+from serializers import SPEAKER_PLAN
+
 from settings import WEB_CLIENT_ID
 
-from utils import getUserId
+from utils import versionSeed
+
+from profiler import profiled
+from rpcstats import instrumentService
+
+from identity import currentProfile
+from identity import currentUser
+from identity import currentUserId
+from identity import setCurrentProfile
 
 __author__ = 'wesc+api@google.com (Wesley Chun) amended by quinlangl@gmail.com (Greg Quinlan'  # noqa
 
@@ -50,9 +121,28 @@ EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
 MEMCACHE_FS_KEY = "FEATURED_SPEAKER"
+MEMCACHE_CONF_FS_KEY = "FEATURED_SPEAKER:%s"
+MEMCACHE_CONFERENCE_KEY = "CONFERENCE:%s"
+MEMCACHE_CONFERENCE_VERSION_KEY = "CONFERENCE_VERSION:%s"
+MEMCACHE_SCHEDULE_KEY = "SCHEDULE:%s"
+MEMCACHE_SCHEDULE_VERSION_KEY = "SCHEDULE_VERSION:%s"
 ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
                     'are nearly sold out: %s')
 ANNOUNCEMENT_FS = ('New speaker added! Now featuring %s in %s')
+LOW_SEATS = 5
+QUERY_PAGE_SIZE = 20
+QUERY_MAX_PAGE_SIZE = 100
+QUERY_MAX_SCAN = 1000
+EXPORT_PAGE_SIZE = 500
+REGISTRATION_BATCH_MAX = 25
+GROUP_SEATS_MAX = 10
+# attendee cursors of the users who only hold group seats start with this
+GROUP_CURSOR_PREFIX = 'group.'
+IMPORT_MAX_SESSIONS = 500
+SESSION_PUT_CHUNK = 100
+SESSION_BATCH = 100
+MIGRATE_CHUNK = 200
+INDEX_TASK_KEYS = 100
 
 DEFAULTS = {
     "city": "Default City",
@@ -77,6 +167,9 @@ FIELDS = {
             'MAX_ATTENDEES': 'maxAttendees',
             }
 
+CONFERENCE_PLANNER = QueryPlanner(
+    Conference, loadIndexes('Conference'), order='name')
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
@@ -102,6 +195,11 @@ SESS_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+SESS_IMPORT_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(1, required=True),
+)
+
 SESSION_TYPE_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
@@ -131,11 +229,42 @@ SESSION_DATE_REQUEST = endpoints.ResourceContainer(
     sessdate=messages.StringField(2, required=True)
 )
 
+FS_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+)
+
 SPEAK_CITY_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     city=messages.StringField(1, required=True)
 )
 
+SPEAK_SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    prefix=messages.StringField(1, required=True)
+)
+
+SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1, required=True),
+    kind=messages.StringField(2),
+    pageSize=messages.IntegerField(3),
+    offset=messages.IntegerField(4),
+)
+
+ATTENDEES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1, required=True),
+    pageSize=messages.IntegerField(2),
+    websafeCursor=messages.StringField(3),
+)
+
+GROUP_RELEASE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1, required=True),
+    seats=messages.IntegerField(2),
+)
+
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -145,50 +274,66 @@ SPEAK_CITY_REQUEST = endpoints.ResourceContainer(
     version='v1',
     allowed_client_ids=[WEB_CLIENT_ID, API_EXPLORER_CLIENT_ID],
     scopes=[EMAIL_SCOPE])
+@instrumentService
 class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
 #  - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
+    def _copyConferenceToForm(self, conf, displayName=None, validate=True,
+                              seats=None):
         """Copy relevant fields from Conference to ConferenceForm.
             Args:   conf: conference entity
-                    displayName: Name of conference
+                    displayName: Name of conference organizer, for
+                        conferences without organizerDisplayName
+                    validate: check that all required fields are present
+                    seats: seats available, aggregated from the seat
+                        shards; looked up if not given
             Returns:    Conference Form
         """
-        # Establish empty conference form
-        cf = ConferenceForm()
-        # For every field in the form
-        for field in cf.all_fields():
-            # If the Conference entitry has the field name as a property
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    # Assign the form field to the value in the entity property
-                    setattr(cf, field.name, getattr(conf, field.name))
-            # Special handling for the websafeKey field
-            elif field.name == "websafeKey":
-                # Assign the field from the conference key
-                setattr(cf, field.name, conf.key.urlsafe())
-        # Assign the displayName to the form from the function arg if exists
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        # Check that all required fields are present
-        cf.check_initialized()
+        cf = CONFERENCE_PLAN.copy(conf, displayName, validate=False)
+        if seats is None:
+            seats = seatsAvailable(conf)
+        cf.seatsAvailable = seats
+        if validate:
+            cf.check_initialized()
         return cf
 
+    def _copyConferencesToForms(self, confs, validate=False):
+        """Copy Conferences to ConferenceForms, looking up missing organizer
+        names and aggregating seat shards concurrently."""
+        # both tasklets issue their RPCs before either result is awaited
+        names_future = self._getOrganizerNamesAsync(confs)
+        seats_future = seatsAvailableMultiAsync(confs)
+        names = names_future.get_result()
+        seats = seats_future.get_result()
+        return [self._copyConferenceToForm(
+            conf, names.get(conf.organizerUserId), validate=validate,
+            seats=seats[conf.key]) for conf in confs]
+
+    @ndb.tasklet
+    def _getOrganizerNamesAsync(self, confs):
+        """Return a future for organizer displayNames by user id, fetched
+        from profiles for conferences created before organizerDisplayName
+        was stored; empty, without any RPC, once every conference has the
+        name."""
+        p_keys = list(set(ndb.Key(Profile, conf.organizerUserId)
+                          for conf in confs
+                          if conf.organizerDisplayName is None))
+        profs = yield ndb.get_multi_async(p_keys)
+        raise ndb.Return(dict(
+            (prof.key.id(), prof.displayName) for prof in profs if prof))
+
     def _createConferenceObject(self, request):
         """Create or update Conference object. Sends confirm email to task
             Args: Request
             Returns: ConferenceForm/request
         """
         # preload necessary data items
-        user = endpoints.get_current_user()
+        user = currentUser()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
         if not request.name:
             raise endpoints.BadRequestException(
@@ -198,7 +343,6 @@ class ConferenceApi(remote.Service):
         data = {field.name: getattr(
             request, field.name) for field in request.all_fields()}
         del data['websafeKey']
-        del data['organizerDisplayName']
 
         # add default values for missing (both data model & outbound Message)
         for df in DEFAULTS:
@@ -232,30 +376,42 @@ class ConferenceApi(remote.Service):
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
+        # store the organizer's displayName so lists need not fetch it
+        prof = p_key.get()
+        data['organizerDisplayName'] = request.organizerDisplayName = (
+            getattr(prof, 'displayName', None))
+
+        # spread the seats over shards; the entity keeps no count itself
+        shards = createShards(c_key, data['seatsAvailable'])
+        data['seatShards'] = len(shards)
+        data['seatsAvailable'] = None
 
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
+        ndb.put_multi([Conference(**data)] + shards)
         taskqueue.add(params={
             'email': user.email(),
             'conferenceInfo': repr(request)},
             url='/tasks/send_confirmation_email'
         )
+        self._queueIndexing([c_key])
         return request
 
-    @ndb.transactional()
+    @ndb.transactional(xg=True)
     def _updateConferenceObject(self, request):
-        user = endpoints.get_current_user()
+        user = currentUser()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(
             request, field.name) for field in request.all_fields()}
 
-        # update existing conference
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        # get existing conference and organizer profile in one batch
+        conf, prof = ndb.get_multi([
+            ndb.Key(urlsafe=request.websafeConferenceKey),
+            ndb.Key(Profile, user_id)])
         # check that conference exists
         if not conf:
             raise endpoints.NotFoundException(
@@ -269,8 +425,16 @@ class ConferenceApi(remote.Service):
 
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
+        maxAttendees = conf.maxAttendees or 0
+        city = conf.city
         for field in request.all_fields():
             data = getattr(request, field.name)
+            # seats of a sharded conference only change through the shards
+            if conf.seatShards and field.name == 'seatsAvailable':
+                continue
+            # organizerDisplayName is kept in step with the Profile
+            if field.name == 'organizerDisplayName':
+                continue
             # only copy fields where we get data
             if data not in (None, []):
                 # special handling for dates (convert string to Date)
@@ -280,9 +444,22 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
-        conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        # a change in capacity adds or removes seats from the shards
+        shards = []
+        if conf.seatShards and conf.maxAttendees != maxAttendees:
+            shards = adjustSeats(conf, (conf.maxAttendees or 0) - maxAttendees)
+        conf.organizerDisplayName = getattr(prof, 'displayName', None)
+        ndb.put_multi([conf] + shards)
+        # move the conference's speakers to the new city's index
+        if conf.city != city:
+            taskqueue.add(params={
+                'websafeConferenceKey': request.websafeConferenceKey,
+                'oldCity': city or ''},
+                url='/tasks/index_speaker_cities',
+                transactional=True
+            )
+        self._queueIndexing([conf.key], transactional=True)
+        return self._copyConferenceToForm(conf)
 
     @endpoints.method(
         ConferenceForm, ConferenceForm, path='conference', http_method='POST',
@@ -297,7 +474,105 @@ class ConferenceApi(remote.Service):
         name='updateConference')
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
-        return self._updateConferenceObject(request)
+        cf = self._updateConferenceObject(request)
+        # refresh the cache and LowSeats index once the transaction committed
+        self._conferenceChanged(
+            [ndb.Key(urlsafe=request.websafeConferenceKey)])
+        return cf
+
+    def _conferenceChanged(self, c_keys):
+        """Refresh what is derived from conferences after their seats or
+        fields changed: the cached ConferenceForms, the LowSeats index & the
+        change log."""
+        self._invalidateConferenceCache(c_keys)
+        confs = [conf for conf in ndb.get_multi(c_keys) if conf]
+        seats = seatsAvailableMulti(confs)
+        for conf in confs:
+            changes.publish('seats', {'seatsAvailable': seats[conf.key]},
+                            conf.key.urlsafe())
+        self._checkLowSeats(confs, seats)
+
+    def _seatChanged(self, c_key, shard, delta):
+        """Refresh what is derived from a conference after seats were
+        taken from (delta < 0) or given back to (delta > 0) shard. A
+        conference with at most LOW_SEATS seats has at most LOW_SEATS on
+        every shard, so unless the shard is down to LOW_SEATS (LOW_SEATS +
+        delta when seats came back) the conference neither was nor is
+        nearly sold out; then only the cached ConferenceForm is invalidated
+        and the seat delta published, without reading the conference or
+        its shards."""
+        if shard.seatsAvailable <= LOW_SEATS + max(delta, 0):
+            self._conferenceChanged([c_key])
+            return
+        # bump the cache version while the change is published
+        rpc = memcache.Client().offset_multi_async(
+            {MEMCACHE_CONFERENCE_VERSION_KEY % c_key.urlsafe(): 1},
+            initial_value=versionSeed())
+        changes.publish('seats', {'delta': delta}, c_key.urlsafe())
+        rpc.get_result()
+
+    @staticmethod
+    def _invalidateConferenceCache(c_keys):
+        """Bump the cache version of the given conferences so that any
+        cached ConferenceForm, including one being written by a reader that
+        loaded the entity before the change, is never served again."""
+        if not c_keys:
+            return
+        memcache.offset_multi(
+            dict((MEMCACHE_CONFERENCE_VERSION_KEY % c_key.urlsafe(), 1)
+                 for c_key in c_keys),
+            initial_value=versionSeed())
+
+    @staticmethod
+    def _cacheVersions(vkeys):
+        """Return the current values of the cache version counters vkeys,
+        starting a counter for any that has none."""
+        client = memcache.Client()
+        versions = client.get_multi(vkeys)
+        missing = dict((vkey, versionSeed())
+                       for vkey in vkeys if versions.get(vkey) is None)
+        if missing:
+            client.add_multi(missing)
+            versions.update(client.get_multi(missing.keys()))
+        return versions
+
+    def _getCachedConferenceForm(self, c_key):
+        """Return the ConferenceForm for c_key, read through memcache.
+        Entries are tagged with the conference's cache version and only
+        replace an entry tagged with an older version."""
+        wsck = c_key.urlsafe()
+        vkey = MEMCACHE_CONFERENCE_VERSION_KEY % wsck
+        ckey = MEMCACHE_CONFERENCE_KEY % wsck
+        client = memcache.Client()
+        cached = client.get_multi([vkey, ckey], for_cas=True)
+
+        # read the current version, starting a counter if there is none
+        version = cached.get(vkey)
+        if version is None:
+            version = versionSeed()
+            if not client.add(vkey, version):
+                version = client.get(vkey)
+
+        # serve the cached form if it was built at the current version
+        entry = cached.get(ckey)
+        if entry and entry[0] == version:
+            return protojson.decode_message(ConferenceForm, entry[1])
+
+        # otherwise build it from the datastore
+        conf = c_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        cf = self._copyConferencesToForms([conf], validate=True)[0]
+
+        # store it unless a newer version is already cached
+        if version is not None:
+            value = (version, protojson.encode_message(cf))
+            if entry is None:
+                client.add(ckey, value)
+            elif entry[0] < version:
+                client.cas(ckey, value)
+        return cf
 
     @endpoints.method(
         CONF_GET_REQUEST, ConferenceForm,
@@ -305,15 +580,9 @@ class ConferenceApi(remote.Service):
         name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s'
-                % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
-        # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        # get ConferenceForm from cache or datastore; bail if not found
+        return self._getCachedConferenceForm(
+            ndb.Key(urlsafe=request.websafeConferenceKey))
 
     @endpoints.method(
         message_types.VoidMessage, ConferenceForms,
@@ -322,134 +591,125 @@ class ConferenceApi(remote.Service):
     def getConferencesCreated(self, request):
         """Return conferences created by user."""
         # make sure user is authed
-        user = endpoints.get_current_user()
+        user = currentUser()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        confs = Conference.query(ancestor=ndb.Key(Profile, user_id)).fetch()
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(
-                prof, 'displayName')) for conf in confs]
-        )
-
-    def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+        return ConferenceForms(items=self._copyConferencesToForms(confs))
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
-
-        for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(
-                filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+    def _getQueryPlan(self, request):
+        """Return the query plan for the submitted filters."""
+        return CONFERENCE_PLANNER.plan(self._formatFilters(request.filters))
 
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
-        formatted_filters = []
-        inequality_field = None
-
+        predicates = []
         for f in filters:
-            filtr = {field.name: getattr(
-                f, field.name) for field in f.all_fields()}
-
             try:
-                filtr["field"] = FIELDS[filtr["field"]]
-                filtr["operator"] = OPERATORS[filtr["operator"]]
+                field = FIELDS[f.field]
+                op = OPERATORS[f.operator]
             except KeyError:
                 raise endpoints.BadRequestException(
                     "Filter contains invalid field or operator.")
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                # check if inequality operation used in previous filters
-                # disallow the filter if inequality was performed on a
-                # different field before
-                if inequality_field and inequality_field != filtr["field"]:
+            value = f.value
+            if field in ["month", "maxAttendees"]:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
                     raise endpoints.BadRequestException(
-                        "Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
+                        "Filter on %s needs a number." % f.field)
 
-            formatted_filters.append(filtr)
-        return (inequality_field, formatted_filters)
+            # any number of inequality fields is allowed; the planner
+            # applies those no index can serve in memory
+            predicates.append(Predicate(
+                field, op, value, Conference._properties[field]._repeated))
+        return predicates
 
     @endpoints.method(
         ConferenceQueryForms, ConferenceForms, path='queryConferences',
         http_method='POST', name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences, one page at a time."""
+        plan = self._getQueryPlan(request)
+        logging.debug('queryConferences plan:\n%s', plan.explain())
+
+        # clamp the requested page size
+        page_size = request.pageSize or QUERY_PAGE_SIZE
+        if page_size < 1 or page_size > QUERY_MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'pageSize must be between 1 and %d.' % QUERY_MAX_PAGE_SIZE)
 
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(
-            Profile, conf.organizerUserId)) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+        # resume from the cursor handed out with the previous page
+        cursor = None
+        if request.websafeCursor:
+            try:
+                cursor = Cursor(urlsafe=request.websafeCursor)
+            except datastore_errors.BadValueError:
+                raise endpoints.BadRequestException(
+                    'Invalid websafeCursor: %s' % request.websafeCursor)
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        # run the query once for this page only
+        conferences, next_cursor, more = plan.fetchPage(
+            page_size, start_cursor=cursor, max_scan=QUERY_MAX_SCAN)
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-                items=[self._copyConferenceToForm(
-                    conf, names[conf.organizerUserId]) for conf in conferences]
+                items=self._copyConferencesToForms(conferences),
+                nextWebsafeCursor=(
+                    next_cursor.urlsafe() if more and next_cursor else None)
         )
 
-# - - - Session objects - - - - - - - - - - - - - - - - - - -
+    @endpoints.method(
+        ConferenceQueryForms, StringMessage,
+        path='queryConferences/explain', http_method='POST',
+        name='explainQueryConferences')
+    def explainQueryConferences(self, request):
+        """Describe how queryConferences would run the given filters."""
+        return StringMessage(data=self._getQueryPlan(request).explain())
 
-    def _copySessionToForm(self, sess):
-        """Copy relevant fields from Session to SessionForm."""
-        # Establish blank Session Form
-        sf = SessionForm()
-        # For every field in the form
-        for field in sf.all_fields():
-            if hasattr(sess, field.name):
-                # convert Date to date string; just copy others
-                if field.name in ('date', 'startTime'):
-                    setattr(sf, field.name, str(getattr(sess, field.name)))
-                elif field.name == 'speakerKey':
-                    setattr(sf, field.name, sess.speakerKey.urlsafe())
-                else:
-                    setattr(sf, field.name, getattr(sess, field.name))
-            elif field.name == 'websafeKey':
-                setattr(sf, field.name, sess.key.urlsafe())
-            elif field.name == 'conferenceName':
-                setattr(sf, field.name, sess.key.parent().get().name)
-
-        sf.check_initialized()
-        return sf
+# - - - Session objects - - - - - - - - - - - - - - - - - - -
 
-    def _createSessionObject(self, request):
-        """Create or update Session object, returning SessionForm/request.
+    def _copySessionToForm(self, sess, related=None, validate=True):
+        """Copy relevant fields from Session to SessionForm.
+            Args:   sess: session entity
+                    related: dict of parent conference and speaker
+                        entities by key, from _getSessionRelated
+                    validate: check that all required fields are present
+            Returns:    Session Form
         """
-        # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-
-        # check if user owns conference
-        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        conf = c_key.get()
-        if conf.organizerUserId != user_id:
-            raise endpoints.UnauthorizedException(
-                'User not authorized to add sessions.')
+        # look up parent conference and speaker if not already batched
+        if related is None:
+            related = self._getSessionRelated([sess])
+        return SESSION_PLAN.copy(sess, related, validate)
+
+    def _getSessionRelated(self, sessions):
+        """Fetch the parent conferences and speakers of the given sessions
+        with a single get_multi; returns a dict of entities by key."""
+        keys = set()
+        for sess in sessions:
+            keys.add(sess.key.parent())
+            if sess.speakerKey:
+                keys.add(sess.speakerKey)
+        keys = list(keys)
+        return dict(zip(keys, ndb.get_multi(keys)))
+
+    def _copySessionsToForms(self, sessions):
+        """Copy Sessions to SessionForms, batching related entity lookups."""
+        # skip missing entities, eg stale keys from get_multi
+        sessions = [sess for sess in sessions if sess]
+        related = self._getSessionRelated(sessions)
+        return SessionForms(
+            items=[self._copySessionToForm(sess, related, validate=False)
+                   for sess in sessions])
 
+    def _sessionData(self, request):
+        """Validate a SessionForm and convert it to Session properties,
+        without key or speakerKey."""
         # confirm required fields
         if not request.name:
             raise endpoints.BadRequestException(
@@ -467,52 +727,170 @@ class ConferenceApi(remote.Service):
         data = {field.name: getattr(request, field.name) for field in
                 request.all_fields()}
 
-        # Verify valid speaker, store speaker entity for later
-        if request.speakerName:
-            speak = Speaker.query(
-                Speaker.displayName == request.speakerName).get()
-            if not speak:
-                raise endpoints.BadRequestException(
-                    "Speaker has not been entered.")
-
         # Remove fields from data that are not in Session
         del data['websafeKey']
         del data['conferenceName']
         del data['speakerName']
-        del data['websafeConferenceKey']
+        del data['speakerKey']
+        data.pop('websafeConferenceKey', None)
 
         # convert dates from strings to Date objects; set month on start_date
-        if data['date']:
+        try:
             data['date'] = datetime.datetime.strptime(
                 data['date'][:10], "%Y-%m-%d").date()
-        if data['startTime']:
-            try:
-                data['startTime'] = datetime.datetime.strptime(
-                    data['startTime'], "%H:%M").time()
-            except ValueError:
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "date must be formatted %Y-%m-%d.")
+        try:
+            data['startTime'] = datetime.datetime.strptime(
+                data['startTime'], "%H:%M").time()
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "startTime must be formatted 24 hour %H:%M.")
+        return data
+
+    def _createSessionObject(self, request):
+        """Create or update Session object, returning SessionForm/request.
+        """
+        # preload necessary data items
+        user = currentUser()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = currentUserId()
+
+        # confirm required fields and convert them
+        data = self._sessionData(request)
+
+        # start the independent RPCs together: the conference, the speaker
+        # lookup and the new Session ID with Conference key as parent
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf_future = c_key.get_async()
+        speak_future = None
+        if request.speakerName:
+            speak_future = speakersByNameAsync([request.speakerName])
+        ids_future = Session.allocate_ids_async(size=1, parent=c_key)
+
+        # check if user owns conference
+        conf = conf_future.get_result()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
+        if conf.organizerUserId != user_id:
+            raise endpoints.UnauthorizedException(
+                'User not authorized to add sessions.')
+
+        # Verify valid speaker, store speaker entity for later
+        speak = None
+        if speak_future:
+            speak = speak_future.get_result().get(request.speakerName)
+            if not speak:
                 raise endpoints.BadRequestException(
-                    "startTime must be formatted 24 hour %H:%M.")
-
-        # allocate new Session ID with Conference key as parent
-        s_id = Session.allocate_ids(size=1, parent=c_key)[0]
-        # make Session key from ID
-        s_key = ndb.Key(Session, s_id, parent=c_key)
-        data['key'] = s_key
-
-        # create Session, set featured speaker, return sessionForm
-        Session(**data).put()
-        sess = s_key.get()
-        # The speakerKey seems to want to be put in this way
-        if speak:
-            sess.speakerKey = speak.key
-            sess.put()
+                    "Speaker has not been entered.")
 
+        # build the complete Session in memory and write it once
+        s_key = ndb.Key(Session, ids_future.get_result()[0], parent=c_key)
+        sess = Session(key=s_key, speakerKey=speak and speak.key, **data)
+        sess.put()
+        self._queueIndexing([s_key])
+
+        # set featured speaker
+        if speak:
             taskqueue.add(params={
                 'websafeSessionKey': s_key.urlsafe()},
                 url='/tasks/set_featured_speaker'
             )
 
-        return self._copySessionToForm(sess=sess)
+        # return sessionForm from the entities already in hand
+        related = {c_key: conf}
+        if speak:
+            related[speak.key] = speak
+        return self._copySessionToForm(sess, related)
+
+    def _createSessionObjects(self, conf, requests, speakers):
+        """Create many sessions for a conference with one allocate_ids range
+        and concurrent put_multi chunks, for conference schedule imports.
+            Args:   conf: parent conference entity
+                    requests: SessionForms to create
+                    speakers: dict of Speaker entities by displayName,
+                        covering every speakerName in requests
+            Returns:    list of the created Sessions
+        """
+        # validate the whole schedule before writing any of it
+        data = [self._sessionData(request) for request in requests]
+        for request in requests:
+            if request.speakerName and request.speakerName not in speakers:
+                raise endpoints.BadRequestException(
+                    "Speaker has not been entered: %s" % request.speakerName)
+        if not requests:
+            return []
+
+        # allocate one contiguous range of Session IDs
+        first, last = Session.allocate_ids(
+            size=len(requests), parent=conf.key)
+        sessions = []
+        for s_id, request, props in zip(
+                range(first, last + 1), requests, data):
+            speak = speakers.get(request.speakerName)
+            sessions.append(Session(
+                key=ndb.Key(Session, s_id, parent=conf.key),
+                speakerKey=speak and speak.key, **props))
+        futures = []
+        for i in range(0, len(sessions), SESSION_PUT_CHUNK):
+            futures.extend(ndb.put_multi_async(
+                sessions[i:i + SESSION_PUT_CHUNK]))
+        ndb.Future.wait_all(futures)
+        for future in futures:
+            future.check_success()
+        return sessions
+
+    def _importSessions(self, request):
+        """Create a conference's whole schedule of sessions in one call."""
+        # preload necessary data items
+        user = currentUser()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = currentUserId()
+
+        if not request.items:
+            raise endpoints.BadRequestException(
+                "Session 'items' field required")
+        if len(request.items) > IMPORT_MAX_SESSIONS:
+            raise endpoints.BadRequestException(
+                'At most %d sessions per import.' % IMPORT_MAX_SESSIONS)
+
+        # get the conference and all speakers named in the schedule together
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf_future = c_key.get_async()
+        speakers = speakersByName(
+            [r.speakerName for r in request.items if r.speakerName])
+
+        # check if user owns conference
+        conf = conf_future.get_result()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
+        if conf.organizerUserId != user_id:
+            raise endpoints.UnauthorizedException(
+                'User not authorized to add sessions.')
+
+        sessions = self._createSessionObjects(conf, request.items, speakers)
+        self._queueIndexing([sess.key for sess in sessions])
+
+        # recompute the featured speaker once for the whole conference
+        if any(sess.speakerKey for sess in sessions):
+            taskqueue.add(params={
+                'websafeConferenceKey': c_key.urlsafe()},
+                url='/tasks/set_featured_speaker'
+            )
+
+        # return SessionForms from the entities already in hand
+        related = {c_key: conf}
+        related.update((speak.key, speak) for speak in speakers.values())
+        return SessionForms(
+            items=[self._copySessionToForm(sess, related, validate=False)
+                   for sess in sessions])
 
     @endpoints.method(
         CONF_GET_REQUEST, SessionForms,
@@ -530,8 +908,7 @@ class ConferenceApi(remote.Service):
         sessions = Session.query(ancestor=c_key)
 
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(s) for s in sessions])
+        return self._copySessionsToForms(sessions)
 
     @endpoints.method(
         SESS_POST_REQUEST, SessionForm,
@@ -541,6 +918,14 @@ class ConferenceApi(remote.Service):
         """Create new session."""
         return self._createSessionObject(request)
 
+    @endpoints.method(
+        SESS_IMPORT_REQUEST, SessionForms,
+        path='conference/{websafeConferenceKey}/session/import',
+        http_method='POST', name='importSessions')
+    def importSessions(self, request):
+        """Create many sessions for a conference from a schedule."""
+        return self._importSessions(request)
+
     @endpoints.method(
         SESSION_TYPE_REQUEST, SessionForms,
         path='conference/{websafeConferenceKey}/session/type/{typeOfSession}',  # noqa
@@ -560,8 +945,7 @@ class ConferenceApi(remote.Service):
             Session.typeOfSession == request.typeOfSession)
 
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(s) for s in sesstype])
+        return self._copySessionsToForms(sesstype)
 
     def _sessionWishlist(self, request, wishto=True):
         """Add to user's wishlist for selected session."""
@@ -579,28 +963,28 @@ class ConferenceApi(remote.Service):
             raise ConflictException(
                 "This entity is not a valid session.")
 
+        # the wishlist entry of the session is looked up by key
+        w_key = wishlistKey(prof.key, s_key)
+        entry = w_key.get()
         if wishto:
             # Add to wish list
             # check if session already in wishlist
-            if s_key in prof.sessionWishlistKeys:
+            if entry:
                 raise ConflictException(
                     "You have already added this session to your wishlist")
-
-            # register user, take away one seat
-            prof.sessionWishlistKeys.append(s_key)
+            WishlistEntry(key=w_key, sessionKey=s_key).put()
             retval = True
 
         else:
             # check if session already in wishlist
-            if s_key in prof.sessionWishlistKeys:
-                # unregister user, add back one seat
-                prof.sessionWishlistKeys.remove(s_key)
+            if entry:
+                w_key.delete()
                 retval = True
             else:
                 retval = False
 
-        # write things back to the datastore & return
-        prof.put()
+        if retval:
+            self._invalidateSchedule(prof.key.id())
         return BooleanMessage(data=retval)
 
     def _getSessionsBySpeaker(self, request):
@@ -620,50 +1004,43 @@ class ConferenceApi(remote.Service):
                 % sp_key.get().displayName)
 
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(s) for s in sessions])
+        return self._copySessionsToForms(sessions)
 
     def _getSessionsNotTypeBeforeHour(self, request):
         """Find sessions for the conference before the given hour (24 hour) and
         not of type specified."""
         # get Conference key from request; bail if not found
-        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        c_key = self._conferenceKeyOrNone(request.websafeConferenceKey)
         if not c_key:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' %
                 request.websafeConferenceKey)
+        try:
+            hour = int(request.hour)
+        except ValueError:
+            hour = -1
+        if not 0 <= hour <= 24:
+            raise endpoints.BadRequestException(
+                'Hour must be a number from 0 to 24.')
 
-        # Get a list of all types except the type specified
-        nottype = Session.query(
-            Session.typeOfSession != request.nottype).fetch()
-        if not nottype:
-            raise endpoints.NotFoundException(
-                'No sessions found with type not: %s' % request.nottype)
-        notlist = [r.typeOfSession for r in nottype]
-
-        # For all types in nottype, filter sessionBefore for these types
-        sessnt = Session.query(Session.typeOfSession.IN(notlist))
-        # Filter sessions for those in the specified conference
-        c_sessnt = sessnt.filter(Session.conferenceKey == c_key)
-        # Filter query for sessions that occur before the time
-        qtime = datetime.time(int(request.hour), 0, 0)
-        c_sessntBefore = c_sessnt.filter(Session.startTime < qtime)
+        # One ancestor query on the conference, sorted by startTime; the
+        # datastore allows only one inequality per query, so the type is
+        # excluded in memory while the results stream in
+        sessions = Session.query(ancestor=c_key)
+        if hour < 24:
+            sessions = sessions.filter(
+                Session.startTime < datetime.time(hour, 0, 0))
+        sessions = sessions.order(Session.startTime)
 
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(s) for s in c_sessntBefore])
+        return self._copySessionsToForms(
+            [sess for sess in sessions.iter(batch_size=SESSION_BATCH)
+             if sess.typeOfSession != request.nottype])
 
     def _getSessionsInWishlist(self, request):
         """Get list of sessions that user has in wishlist."""
-        # get user profile
-        prof = self._getProfileFromUser()
-
-        # Fetch session from datastore.
-        sessions = ndb.get_multi(prof.sessionWishlistKeys)
-
-        # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in sessions])
+        # return the wishlist from the user's schedule snapshot
+        return self._getSchedule()[1]
 
     def _getSessionsByDate(self, request):
         """Given a date, return all sessions"""
@@ -683,23 +1060,25 @@ class ConferenceApi(remote.Service):
             except ValueError:
                 raise endpoints.BadRequestException(
                     "Not a valid date. Date must be in format %Y-%m-%d.")
+        # Query for all sessions with the date, alongside the conference
+        conf_future = c_key.get_async()
+        sessions = Session.query(ancestor=c_key)
+        datesess_future = sessions.filter(
+            Session.date == sessdate).fetch_async()
+
         # Confirm that sessdate exists within conference dates, if exist
-        conf = c_key.get()
+        conf = conf_future.get_result()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
         if conf.startDate and conf.endDate:
             if conf.startDate > sessdate or sessdate > conf.endDate:
                 raise endpoints.BadRequestException(
                     "Date is not within conference dates.")
 
-        # Query for all sessions with the date
-        sessions = Session.query(ancestor=c_key)
-        datesess = sessions.filter(Session.date == sessdate)
-        if not datesess:
-            raise endpoints.BadRequestException(
-                    "There are no sessions with that date.")
-
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(s) for s in datesess])
+        return self._copySessionsToForms(datesess_future.get_result())
 
     @endpoints.method(
         SESSION_KEY_REQUEST, BooleanMessage,
@@ -753,29 +1132,24 @@ class ConferenceApi(remote.Service):
 
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(
-                        TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        return PROFILE_PLAN.copy(prof)
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new if non-existent.
+        The Profile is loaded once per request and shared by every caller.
         """
         # make sure user is authed
-        user = endpoints.get_current_user()
+        user = currentUser()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
 
+        # reuse the Profile if this request already loaded it
+        profile = currentProfile()
+        if profile:
+            return profile
+
         # get Profile from datastore
-        user_id = getUserId(user)
+        user_id = currentUserId()
         p_key = ndb.Key(Profile, user_id)
         profile = p_key.get()
         # create new Profile if not there
@@ -787,9 +1161,67 @@ class ConferenceApi(remote.Service):
                 teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
             )
             profile.put()
+        # move memberships still held in the Profile to their own entities
+        elif profile.conferenceKeysToAttend or profile.sessionWishlistKeys:
+            profile = self._migrateMemberships(p_key)
         # return Profile
+        setCurrentProfile(profile)
         return profile
 
+    @staticmethod
+    def _migrateMemberships(p_key):
+        """Replace the Profile's conferenceKeysToAttend & sessionWishlistKeys
+        by Attendance & WishlistEntry entities. The entities are written
+        MIGRATE_CHUNK at a time, so no commit nears the datastore's limit
+        however long the lists are, and the lists are cleared last; a
+        migration cut short is simply repeated, as the entities are keyed
+        by what they record. Returns the updated Profile."""
+        memberships = fromProfile(p_key.get())
+        for i in range(0, len(memberships), MIGRATE_CHUNK):
+            ndb.put_multi(memberships[i:i + MIGRATE_CHUNK])
+        return ConferenceApi._clearLegacyMemberships(
+            p_key, [m.key for m in memberships])
+
+    @staticmethod
+    @ndb.transactional()
+    def _clearLegacyMemberships(p_key, migrated):
+        """Remove the memberships whose entities were written from the
+        Profile's lists, keeping any added meanwhile. Returns the Profile."""
+        prof = p_key.get()
+        migrated = set(migrated)
+        left = [m for m in fromProfile(prof) if m.key not in migrated]
+        prof.conferenceKeysToAttend = [
+            m.conferenceKey for m in left if isinstance(m, Attendance)]
+        prof.sessionWishlistKeys = [
+            m.sessionKey for m in left if isinstance(m, WishlistEntry)]
+        prof.put()
+        return prof
+
+    @staticmethod
+    def _backfillPage(query, websafeCursor, work, keys_only=False):
+        """Call work with one page of results of query, starting at
+        websafeCursor; shared by the backfill tasks, which run a page per
+        task. Returns the websafe cursor of the next page, or None when
+        done."""
+        cursor = Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        results, next_cursor, more = query.fetch_page(
+            QUERY_MAX_PAGE_SIZE, start_cursor=cursor, keys_only=keys_only)
+        work(results)
+        if more and next_cursor:
+            return next_cursor.urlsafe()
+
+    @staticmethod
+    def _backfillMemberships(websafeCursor=None):
+        """Migrate the memberships of one page of profiles; used by the
+        migrate_memberships task. Returns the websafe cursor of the next
+        page, or None when done."""
+        def migrate(profs):
+            for prof in profs:
+                if prof.conferenceKeysToAttend or prof.sessionWishlistKeys:
+                    ConferenceApi._migrateMemberships(prof.key)
+        return ConferenceApi._backfillPage(
+            Profile.query(), websafeCursor, migrate)
+
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
         # get user Profile
@@ -797,6 +1229,7 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            displayName = prof.displayName
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -804,6 +1237,12 @@ class ConferenceApi(remote.Service):
                         setattr(prof, field, str(val))
             # put the modified profile to datastore
             prof.put()
+            # fan the new displayName out to the user's conferences
+            if prof.displayName != displayName:
+                taskqueue.add(params={
+                    'userId': prof.key.id()},
+                    url='/tasks/update_organizer_name'
+                )
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -822,43 +1261,66 @@ class ConferenceApi(remote.Service):
         """Update & return user profile."""
         return self._doProfile(request)
 
+    @staticmethod
+    def _updateOrganizerDisplayName(user_id):
+        """Copy the Profile displayName onto the conferences the user
+        organizes; used by the update_organizer_name task."""
+        c_keys = ConferenceApi._copyOrganizerDisplayName(
+            ndb.Key(Profile, user_id))
+        ConferenceApi._invalidateConferenceCache(c_keys)
+
+    @staticmethod
+    @ndb.transactional()
+    def _copyOrganizerDisplayName(p_key):
+        """Set organizerDisplayName on the Profile's conferences, which all
+        share its entity group. Returns the keys of conferences changed."""
+        prof = p_key.get()
+        if not prof:
+            return []
+        confs = [conf for conf in Conference.query(ancestor=p_key)
+                 if conf.organizerDisplayName != prof.displayName]
+        for conf in confs:
+            conf.organizerDisplayName = prof.displayName
+        return ndb.put_multi(confs)
+
+    @staticmethod
+    def _backfillOrganizerDisplayNames(websafeCursor=None):
+        """Store organizerDisplayName on one page of existing conferences,
+        one organizer at a time; used by the backfill_organizer_names task.
+        Returns the websafe cursor of the next page, or None when done."""
+        def backfill(c_keys):
+            for user_id in set(c_key.parent().id() for c_key in c_keys):
+                ConferenceApi._updateOrganizerDisplayName(user_id)
+        return ConferenceApi._backfillPage(
+            Conference.query(), websafeCursor, backfill, keys_only=True)
+
 # - - - Speaker objects - - - - - - - - - - - - - - - - - - -
 
-    def _copySpeakerToForm(self, speak):
+    def _copySpeakerToForm(self, speak, validate=True):
         """Copy relevant fields from Speaker to SpeakerForm."""
-        # Initialze form, copy existing properties, validate required fields
-        spf = SpeakerForm()
-        for field in spf.all_fields():
-            if hasattr(speak, field.name):
-                setattr(spf, field.name, getattr(speak, field.name))
-            elif field.name == "websafeKey":
-                setattr(spf, field.name, speak.key.urlsafe())
-            elif field.name == "creatorUserId":
-                setattr(spf, field.name, speak.key.parent().id())
-        spf.check_initialized()
-        return spf
+        return SPEAKER_PLAN.copy(speak, validate=validate)
 
     def _createSpeakerObject(self, request):
         """Create or update Speaker object, returning SpeakerForms."""
         # preload necessary data items
-        user = endpoints.get_current_user()
+        user = currentUser()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
-        # confirm required fields
-        if not request.displayName:
+        # confirm required fields; the name keys the speaker's directory
+        # entry, so it must not be blank or longer than a key name
+        if not request.displayName or not normalizeName(request.displayName):
             raise endpoints.BadRequestException(
                 "Speaker 'displayName' field required")
+        if not validName(request.displayName):
+            raise endpoints.BadRequestException(
+                "Speaker 'displayName' must be at most %d bytes."
+                % NAME_MAX_BYTES)
 
-        # Check for existing Speaker created by that user
-        # with the requested displayName
+        # allocate a new Speaker ID with User key as parent
         p_key = ndb.Key(Profile, user_id)
-        exist_speak = Speaker.query(
-            Speaker.displayName == request.displayName, ancestor=p_key).get()
-        if exist_speak:
-            raise endpoints.ConflictException(
-                "That speaker name already exists.")
+        ids_future = Speaker.allocate_ids_async(size=1, parent=p_key)
 
         # copy SpeakerForm/ProtoRPC Message into dict
         data = {field.name: getattr(
@@ -866,44 +1328,210 @@ class ConferenceApi(remote.Service):
         del data['websafeKey']
         del data['creatorUserId']
 
-        # make Profile Key from user ID
-        p_key = ndb.Key(Profile, user_id)
-        # allocate new Speaker ID with User key as parent
-        s_id = Speaker.allocate_ids(size=1, parent=p_key)[0]
         # make Speaker key from ID
-        sp_key = ndb.Key(Speaker, s_id, parent=p_key)
-        data['key'] = sp_key
+        data['key'] = ndb.Key(Speaker, ids_future.get_result()[0],
+                              parent=p_key)
+
+        # create Speaker with its directory entry & return SpeakerForm
+        speak = Speaker(**data)
+        if not self._putSpeaker(speak):
+            raise endpoints.ConflictException(
+                "That speaker name already exists.")
+        forgetPrefixes(speak.displayName)
+        return self._copySpeakerToForm(speak=speak)
 
-        # create Speaker, send email to organizer confirming
-        # creation of Speaker & return (modified) SpeakerForm
-        Speaker(**data).put()
-        spk = sp_key.get()
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _putSpeaker(speak):
+        """Put a new Speaker and its SpeakerName directory entry in one
+        transaction. Returns False if the normalized name is taken."""
+        d_key = directoryKey(speak.displayName)
+        if d_key.get():
+            return False
+        ndb.put_multi([speak, directoryEntry(speak)])
+        return True
+
+    @staticmethod
+    def _backfillSpeakerDirectory(websafeCursor=None):
+        """Add the directory entries of one page of existing speakers; a
+        name already taken keeps its first speaker, and a blank or too long
+        name is logged and skipped. Used by the backfill_speaker_directory
+        task. Returns the websafe cursor of the next page, or None when
+        done."""
+        def backfill(speakers):
+            for speak in speakers:
+                if not validName(speak.displayName or u''):
+                    logging.warning(
+                        'Speaker %s has no valid directory name: %r',
+                        speak.key.urlsafe(), speak.displayName)
+                    continue
+                entry = directoryEntry(speak)
+                SpeakerName.get_or_insert(
+                    entry.key.id(), speakerKey=speak.key,
+                    displayName=speak.displayName)
+                forgetPrefixes(speak.displayName)
+        return ConferenceApi._backfillPage(
+            Speaker.query(), websafeCursor, backfill)
 
-        return self._copySpeakerToForm(speak=spk)
+    @endpoints.method(
+        SPEAK_SEARCH_REQUEST, SpeakerForms, path='speaker/search',
+        http_method='GET', name='searchSpeakers')
+    def searchSpeakers(self, request):
+        """Suggest speakers whose name starts with prefix, for type-ahead;
+        only displayName and websafeKey are set."""
+        prefix = normalizeName(request.prefix or u'')
+        if len(prefix.encode('utf-8')) > NAME_MAX_BYTES:
+            raise endpoints.BadRequestException(
+                'prefix must be at most %d bytes.' % NAME_MAX_BYTES)
+        return SpeakerForms(items=[
+            SpeakerForm(displayName=name, websafeKey=websafeKey)
+            for name, websafeKey in suggest(request.prefix)])
 
     @staticmethod
     def _setFeaturedSpeaker(websafeSessionKey):
-        """ If new speaker has more than one session, set message in cache
-        """
-        # Get the session key and session
-        s_key = ndb.Key(urlsafe=websafeSessionKey)
-        sess = s_key.get()
+        """Count a new session towards its speaker's sessions in the
+        conference; if the speaker has more than one, feature them."""
+        sess = ndb.Key(urlsafe=websafeSessionKey).get()
         # if there is no speakerKey, be done
-        if not sess.speakerKey:
+        if not sess or not sess.speakerKey:
             return
-        # Get the speaker from the key
-        speak = sess.speakerKey.get()
-        # Query for sessions in the conference
-        sessions = Session.query(ancestor=s_key.parent())
-        speaksess = sessions.filter(
-            Session.speakerKey == sess.speakerKey).fetch()
-        # Verify that speaker has more than one session
-        # If featured, assign new, return result
-        count = len(speaksess)
-        if count > 1:
-            announcement = ANNOUNCEMENT_FS % (
-                speak.displayName, (', '.join(s.name for s in speaksess)))
-            memcache.set(MEMCACHE_FS_KEY, announcement)
+        tally = ConferenceApi._tallySpeakerSession(sess)
+        if tally.sessionCount > 1:
+            ConferenceApi._featureSpeaker(sess.key.parent(), tally)
+        # index the speaker under the conference's city; idempotent, so a
+        # retried task does not need to know if it got this far before
+        conf = sess.key.parent().get()
+        if conf and conf.city:
+            ConferenceApi._indexSpeakerCity(
+                sess.speakerKey, conf.city, conf.key)
+
+    @staticmethod
+    @ndb.transactional()
+    def _tallySpeakerSession(sess, add=True):
+        """Add (or remove) the session in its speaker's SpeakerSessions for
+        the conference. Idempotent, so a retried task counts it once.
+        Returns the SpeakerSessions."""
+        c_key = sess.key.parent()
+        t_key = ndb.Key(
+            SpeakerSessions, sess.speakerKey.urlsafe(), parent=c_key)
+        tally = t_key.get() or SpeakerSessions(
+            key=t_key, speakerKey=sess.speakerKey)
+        if add and sess.key not in tally.sessionKeys:
+            tally.sessionKeys.append(sess.key)
+            tally.sessionNames.append(sess.name)
+        elif not add and sess.key in tally.sessionKeys:
+            i = tally.sessionKeys.index(sess.key)
+            del tally.sessionKeys[i]
+            del tally.sessionNames[i]
+        else:
+            return tally
+        tally.sessionCount = len(tally.sessionKeys)
+        tally.put()
+        return tally
+
+    @staticmethod
+    def _setConferenceFeaturedSpeaker(websafeConferenceKey):
+        """Rebuild the conference's SpeakerSessions and feature the speaker
+        with the most sessions (if more than one); used once per schedule
+        import."""
+        c_key = ndb.Key(urlsafe=websafeConferenceKey)
+        tallies = ConferenceApi._rebuildSpeakerSessions(c_key)
+        ConferenceApi._indexSpeakerCities(c_key)
+        if not tallies:
+            return
+        tally = max(tallies, key=lambda t: t.sessionCount)
+        if tally.sessionCount > 1:
+            ConferenceApi._featureSpeaker(c_key, tally)
+
+    @staticmethod
+    @ndb.transactional()
+    def _rebuildSpeakerSessions(c_key):
+        """Recount every SpeakerSessions of the conference from its
+        sessions. Returns the SpeakerSessions."""
+        tallies = {}
+        for sess in Session.query(ancestor=c_key):
+            if not sess.speakerKey:
+                continue
+            tally = tallies.get(sess.speakerKey)
+            if not tally:
+                tally = tallies[sess.speakerKey] = SpeakerSessions(
+                    key=ndb.Key(SpeakerSessions, sess.speakerKey.urlsafe(),
+                                parent=c_key),
+                    speakerKey=sess.speakerKey)
+            tally.sessionKeys.append(sess.key)
+            tally.sessionNames.append(sess.name)
+            tally.sessionCount += 1
+        # drop tallies of speakers no longer in the conference
+        current = set(tally.key for tally in tallies.values())
+        stale = [t_key for t_key in SpeakerSessions.query(
+            ancestor=c_key).fetch(keys_only=True) if t_key not in current]
+        ndb.delete_multi(stale)
+        ndb.put_multi(tallies.values())
+        return tallies.values()
+
+    @staticmethod
+    def _featureSpeaker(c_key, tally):
+        """Store the featured speaker announcement for the conference, and
+        as the latest announcement across conferences."""
+        speak = tally.speakerKey.get()
+        announcement = ANNOUNCEMENT_FS % (
+            speak.displayName, (', '.join(tally.sessionNames)))
+        FeaturedSpeaker(key=ndb.Key(FeaturedSpeaker, 'FEATURED', parent=c_key),
+                        speakerKey=tally.speakerKey,
+                        announcement=announcement).put()
+        memcache.set_multi({
+            MEMCACHE_CONF_FS_KEY % c_key.urlsafe(): announcement,
+            MEMCACHE_FS_KEY: announcement})
+        changes.publish('featuredSpeaker', {'announcement': announcement},
+                        c_key.urlsafe())
+
+    @staticmethod
+    @ndb.transactional()
+    def _indexSpeakerCity(speakerKey, city, c_key, add=True):
+        """Add (or remove) the conference in the speaker's SpeakerCity for
+        the city, deleting it once no conference is left. Idempotent."""
+        i_key = ndb.Key(SpeakerCity, '%s:%s' % (speakerKey.urlsafe(), city))
+        entry = i_key.get() or SpeakerCity(
+            key=i_key, city=city, speakerKey=speakerKey)
+        if add and c_key not in entry.conferenceKeys:
+            entry.conferenceKeys.append(c_key)
+            entry.put()
+        elif not add and c_key in entry.conferenceKeys:
+            entry.conferenceKeys.remove(c_key)
+            if entry.conferenceKeys:
+                entry.put()
+            else:
+                i_key.delete()
+
+    @staticmethod
+    def _indexSpeakerCities(c_key, oldCity=None):
+        """Index every speaker of the conference under its city, removing
+        them from oldCity if the conference moved; used by the
+        index_speaker_cities task and schedule imports."""
+        conf = c_key.get()
+        if not conf:
+            return
+        sp_keys = [tally.speakerKey for tally in SpeakerSessions.query(
+            ancestor=c_key) if tally.sessionCount]
+        for sp_key in sp_keys:
+            if oldCity and oldCity != conf.city:
+                ConferenceApi._indexSpeakerCity(
+                    sp_key, oldCity, c_key, add=False)
+            if conf.city:
+                ConferenceApi._indexSpeakerCity(sp_key, conf.city, c_key)
+
+    @staticmethod
+    def _backfillSpeakerCities(websafeCursor=None):
+        """Index the speakers of one page of existing conferences; used by
+        the backfill_speaker_cities task. Returns the websafe cursor of the
+        next page, or None when done."""
+        def backfill(c_keys):
+            for c_key in c_keys:
+                # sessions created before the tallies existed have none yet
+                ConferenceApi._rebuildSpeakerSessions(c_key)
+                ConferenceApi._indexSpeakerCities(c_key)
+        return ConferenceApi._backfillPage(
+            Conference.query(), websafeCursor, backfill, keys_only=True)
 
     @endpoints.method(
         SpeakerForm, SpeakerForm, path='speaker', http_method='POST',
@@ -917,78 +1545,222 @@ class ConferenceApi(remote.Service):
         http_method='GET', name='getSpeakerByCity')
     def getSpeakerByCity(self, request):
         """Get speakers appearing in a given city."""
-        # Get conferences in the given city
-        conf = Conference.query(Conference.city == request.city).fetch()
-        if not conf:
+        # One keys-only query on the SpeakerCity index; the speaker key is
+        # the part of the key name before the city
+        i_keys = SpeakerCity.query(
+            SpeakerCity.city == request.city).fetch(keys_only=True)
+        if not i_keys:
             raise endpoints.NotFoundException(
-                'No conference found in city: %s' % request.city)
-        # Put the conference ids for that city in an array
-        c_keys = [c.key for c in conf]
-        # Get sessions for each of these conferences
-        sessions = Session.query(Session.conferenceKey.IN(c_keys)).fetch()
-        # Get unduplicated speakers in these sessions into an array
-        sp_keys = []
-        for s in sessions:
-            if sp_keys:
-                if s.speakerKey not in sp_keys:
-                    sp_keys.append(s.speakerKey)
-            else:
-                sp_keys.append(s.speakerKey)
+                'No speakers found in city: %s' % request.city)
+        sp_keys = [ndb.Key(urlsafe=i_key.id().split(':', 1)[0])
+                   for i_key in i_keys]
         # Get Speaker entities for the speaker keys
-        speak = ndb.get_multi(sp_keys)
+        speak = [s for s in ndb.get_multi(sp_keys) if s]
         return SpeakerForms(
-            items=[self._copySpeakerToForm(speak=s) for s in speak])
+            items=[self._copySpeakerToForm(speak=s, validate=False)
+                   for s in speak])
+
+# - - - Full-text search - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _queueIndexing(keys, transactional=False):
+        """Queue index_documents tasks for conferences or sessions, at most
+        INDEX_TASK_KEYS keys per task."""
+        for i in range(0, len(keys), INDEX_TASK_KEYS):
+            taskqueue.add(params={
+                'websafeKeys': ','.join(
+                    key.urlsafe() for key in keys[i:i + INDEX_TASK_KEYS])},
+                url='/tasks/index_documents',
+                transactional=transactional
+            )
+
+    @staticmethod
+    def _indexDocuments(keys):
+        """(Re)index conferences and sessions by key, loading the sessions'
+        speakers for their names. Used by the index_documents task."""
+        docs = [doc for doc in ndb.get_multi(keys) if doc]
+        sp_keys = list(set(doc.speakerKey for doc in docs
+                           if getattr(doc, 'speakerKey', None)))
+        speakers = dict((speak.key, speak) for speak
+                        in ndb.get_multi(sp_keys) if speak)
+        indexDocuments(docs, speakers)
+
+    @staticmethod
+    def _backfillSearchIndex(websafeCursor=None):
+        """Queue indexing of one page of existing conferences and all their
+        sessions. Used by the backfill_search_index task. Returns the
+        websafe cursor of the next page, or None when done."""
+        def backfill(c_keys):
+            ConferenceApi._queueIndexing(c_keys)
+            futures = [Session.query(ancestor=c_key).fetch_async(
+                keys_only=True) for c_key in c_keys]
+            for future in futures:
+                ConferenceApi._queueIndexing(future.get_result())
+        return ConferenceApi._backfillPage(
+            Conference.query(), websafeCursor, backfill, keys_only=True)
+
+    @endpoints.method(
+        SEARCH_REQUEST, SearchResultForms, path='search',
+        http_method='GET', name='search')
+    def searchDocuments(self, request):
+        """Search conferences and sessions by words of their names, topics,
+        city, description, type, highlights and speaker, best matches
+        first; kind limits the results to Conference or Session."""
+        if request.kind not in (None, 'Conference', 'Session'):
+            raise endpoints.BadRequestException(
+                "kind must be 'Conference' or 'Session'")
+        page_size = request.pageSize or QUERY_PAGE_SIZE
+        if page_size < 1 or page_size > QUERY_MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'pageSize must be between 1 and %d.' % QUERY_MAX_PAGE_SIZE)
+        offset = request.offset or 0
+        if offset < 0:
+            raise endpoints.BadRequestException(
+                'offset must not be negative.')
+        results, total = search(
+            request.query, request.kind, offset, page_size)
+        # documents deleted since they were indexed are left out
+        docs = ndb.get_multi([key for key, _ in results])
+        next_offset = offset + len(results)
+        return SearchResultForms(
+            items=[SearchResultForm(kind=key.kind(),
+                                    websafeKey=key.urlsafe(),
+                                    name=doc.name, score=score)
+                   for (key, score), doc in zip(results, docs) if doc],
+            total=total,
+            nextOffset=next_offset if next_offset < total else None)
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
     def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
+        """Re-check the conferences in the LowSeats index & assign the
+        Announcement to memcache; used by the memcache cron job as a
+        consistency check behind the incremental updates. Conferences the
+        updates missed adding are found by the sweep_low_seats task it
+        queues, a page of shards at a time.
         """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
+        # unsharded conferences still count seats on the entity itself
+        c_keys = Conference.query(ndb.AND(
+            Conference.seatsAvailable <= LOW_SEATS,
+            Conference.seatsAvailable > 0)).fetch(keys_only=True)
+        i_key = ndb.Key(LowSeats, 'LOW_SEATS')
+        index = i_key.get()
+        if index:
+            c_keys.extend(index.conferenceKeys)
+        c_keys = list(set(c_keys))
+        confs = ndb.get_multi(c_keys)
+        for c_key, conf in zip(c_keys, confs):
+            if not conf:
+                ConferenceApi._updateLowSeats(c_key)
+        ConferenceApi._checkLowSeats([conf for conf in confs if conf])
+        taskqueue.add(url='/tasks/sweep_low_seats')
+        return ConferenceApi._setAnnouncement(i_key.get())
 
-        if confs:
+    @staticmethod
+    def _sweepLowSeats(websafeCursor=None):
+        """Add any nearly sold out conference missing from the LowSeats
+        index, for one page of shards; used by the sweep_low_seats task.
+        A nearly sold out conference has every shard at or below the
+        threshold and at least one with seats left, so only the
+        conferences of such shards are read. Returns the websafe cursor of
+        the next page, or None when done."""
+        def sweep(shards):
+            confs = [conf for conf in ndb.get_multi(
+                list(set(shard.conferenceKey for shard in shards))) if conf]
+            ConferenceApi._checkLowSeats(confs)
+        return ConferenceApi._backfillPage(
+            SeatShard.query(ndb.AND(
+                SeatShard.seatsAvailable <= LOW_SEATS,
+                SeatShard.seatsAvailable > 0)),
+            websafeCursor, sweep)
+
+    @staticmethod
+    def _setAnnouncement(index):
+        """Format the Announcement from the LowSeats index & assign it to
+        memcache."""
+        if index and index.names:
             # If there are almost sold out conferences,
             # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+            announcement = ANNOUNCEMENT_TPL % (', '.join(index.names))
         else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
+            # If there are no sold out conferences, cache the empty
+            # announcement so getAnnouncement need not read the index
             announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
+        if memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) != announcement:
+            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+            changes.publish('announcement', {'announcement': announcement})
         return announcement
 
+    @staticmethod
+    def _checkLowSeats(confs, seats=None):
+        """After seats changed, add or remove each conference from the
+        LowSeats index if it crossed the nearly sold out threshold."""
+        seats = seats or seatsAvailableMulti(confs)
+        index = ndb.Key(LowSeats, 'LOW_SEATS').get() or LowSeats()
+        listed = dict(zip(index.conferenceKeys, index.names))
+        for conf in confs:
+            low = 0 < seats[conf.key] <= LOW_SEATS
+            if low != (conf.key in listed) or (
+                    low and listed[conf.key] != conf.name):
+                ConferenceApi._setAnnouncement(
+                    ConferenceApi._updateLowSeats(conf.key))
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _updateLowSeats(c_key):
+        """Add or remove the conference from the LowSeats index according
+        to its seats, read in the same transaction. Returns the index."""
+        i_key = ndb.Key(LowSeats, 'LOW_SEATS')
+        index, conf = ndb.get_multi([i_key, c_key])
+        index = index or LowSeats(key=i_key)
+        if c_key in index.conferenceKeys:
+            i = index.conferenceKeys.index(c_key)
+            del index.conferenceKeys[i]
+            del index.names[i]
+        if conf and 0 < seatsAvailable(conf) <= LOW_SEATS:
+            index.conferenceKeys.append(c_key)
+            index.names.append(conf.name)
+        index.put()
+        return index
+
     @endpoints.method(
         message_types.VoidMessage, StringMessage,
         path='conference/announcement/get', http_method='GET',
         name='getAnnouncement')
     def getAnnouncement(self, request):
-        """Return Announcement from memcache."""
-        return StringMessage(
-            data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        """Return Announcement from memcache, or from the LowSeats index."""
+        announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+        if announcement is None:
+            announcement = self._setAnnouncement(
+                ndb.Key(LowSeats, 'LOW_SEATS').get())
+        return StringMessage(data=announcement)
 
     @endpoints.method(
-        message_types.VoidMessage, StringMessage,
+        FS_GET_REQUEST, StringMessage,
         path='conference/featuredspeaker/get', http_method='GET',
         name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
-        """Return Featured Speaker from memcache."""
-        return StringMessage(
-            data=memcache.get(MEMCACHE_FS_KEY) or "")
+        """Return Featured Speaker of a conference, or the latest one across
+        conferences, from memcache."""
+        if not request.websafeConferenceKey:
+            return StringMessage(
+                data=memcache.get(MEMCACHE_FS_KEY) or "")
+
+        # fall back to the stored announcement if memcache lost it
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        mkey = MEMCACHE_CONF_FS_KEY % c_key.urlsafe()
+        announcement = memcache.get(mkey)
+        if announcement is None:
+            featured = ndb.Key(FeaturedSpeaker, 'FEATURED', parent=c_key).get()
+            announcement = featured.announcement if featured else ""
+            memcache.set(mkey, announcement)
+        return StringMessage(data=announcement)
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
-        retval = None
         # get user Profile
         prof = self._getProfileFromUser()
 
@@ -1000,40 +1772,79 @@ class ConferenceApi(remote.Service):
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        # move conferences created before seat sharding onto shards
+        if not conf.seatShards:
+            conf = self._shardConferenceSeats(c_key)
+
+        # unregister, giving the seat back to any shard
+        if not reg:
+            shard = self._releaseSeat(prof.key, c_key, randomShardKey(conf))
+            if shard:
+                self._invalidateSchedule(prof.key.id())
+                # seatsAvailable changed; refresh now the transaction committed
+                self._seatChanged(c_key, shard, 1)
+            return BooleanMessage(data=bool(shard))
+
+        # register, trying shards with seats left in random order; a shard
+        # emptied by a concurrent registration is skipped
+        for shard_key in openShardKeys(conf):
+            shard = self._reserveSeat(prof.key, c_key, shard_key)
+            if shard:
+                self._invalidateSchedule(prof.key.id())
+                self._seatChanged(c_key, shard, -1)
+                return BooleanMessage(data=True)
+        raise ConflictException(
+            "There are no seats available.")
 
-        # register
-        if reg:
-            # check if user already registered otherwise add
-            if c_key in prof.conferenceKeysToAttend:
-                raise ConflictException(
-                    "You have already registered for this conference")
-
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
-
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(c_key)
-            conf.seatsAvailable -= 1
-            retval = True
+    @ndb.transactional(xg=True)
+    def _reserveSeat(self, p_key, c_key, shard_key):
+        """Take one seat from the shard and record the profile's Attendance
+        of the conference. Returns the updated shard, or False if it has no
+        seats left."""
+        a_key = attendanceKey(p_key, c_key)
+        attendance, shard = ndb.get_multi([a_key, shard_key])
+        # check if user already registered otherwise add
+        if attendance:
+            raise ConflictException(
+                "You have already registered for this conference")
+        if shard.seatsAvailable <= 0:
+            return False
 
-        # unregister
-        else:
-            # check if user already registered
-            if c_key in prof.conferenceKeysToAttend:
+        # register user, take away one seat
+        shard.seatsAvailable -= 1
+        ndb.put_multi([Attendance(key=a_key, conferenceKey=c_key), shard])
+        return shard
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(c_key)
-                conf.seatsAvailable += 1
-                retval = True
-            else:
-                retval = False
+    @ndb.transactional(xg=True)
+    def _releaseSeat(self, p_key, c_key, shard_key):
+        """Delete the profile's Attendance of the conference and give one
+        seat back to the shard. Returns the updated shard, or False if the
+        user was not registered."""
+        a_key = attendanceKey(p_key, c_key)
+        attendance, shard = ndb.get_multi([a_key, shard_key])
+        # check if user already registered
+        if not attendance:
+            return False
+
+        # unregister user, add back one seat
+        shard.seatsAvailable += 1
+        a_key.delete()
+        shard.put()
+        return shard
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _shardConferenceSeats(c_key):
+        """Move an unsharded conference's seatsAvailable onto seat shards.
+        Returns the updated conference."""
+        conf = c_key.get()
+        if conf.seatShards:
+            return conf
+        shards = createShards(c_key, conf.seatsAvailable)
+        conf.seatShards = len(shards)
+        conf.seatsAvailable = None
+        ndb.put_multi([conf] + shards)
+        return conf
 
     @endpoints.method(
         message_types.VoidMessage, ConferenceForms,
@@ -1041,24 +1852,58 @@ class ConferenceApi(remote.Service):
         name='getConferencesToAttend')
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
-        # get user Profile
-        prof = self._getProfileFromUser()
-        conferences = ndb.get_multi(prof.conferenceKeysToAttend)
-
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in
-                      conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        # return the conferences from the user's schedule snapshot
+        return self._getSchedule()[0]
 
-        # return set of ConferenceForm objects per Conference
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(
-                conf, names[conf.organizerUserId]) for conf in conferences])
+    @staticmethod
+    def _invalidateSchedule(user_id):
+        """Bump the user's schedule version after their conferences or
+        wishlist changed, so that no snapshot built before is served."""
+        memcache.incr(MEMCACHE_SCHEDULE_VERSION_KEY % user_id,
+                      initial_value=versionSeed())
+
+    def _getSchedule(self):
+        """Return (ConferenceForms, SessionForms) of the user's conferences
+        to attend and wishlist sessions, from a memcache snapshot. The
+        snapshot records the versions of the user's schedule and of every
+        conference it shows (also for the conferenceName of sessions); it
+        is rebuilt once any of them changed."""
+        user = currentUser()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = currentUserId()
+        skey = MEMCACHE_SCHEDULE_KEY % user_id
+        snapshot = memcache.get(skey)
+        if snapshot:
+            versions, conferences, sessions = snapshot
+            if memcache.get_multi(versions.keys()) == versions:
+                return (protojson.decode_message(ConferenceForms, conferences),
+                        protojson.decode_message(SessionForms, sessions))
+
+        # read each version before the entities it covers, so a change
+        # made while building leaves the snapshot stale
+        versions = self._cacheVersions(
+            [MEMCACHE_SCHEDULE_VERSION_KEY % user_id])
+        prof = self._getProfileFromUser()
+        attend_future = conferenceKeysToAttendAsync(prof.key)
+        wish_future = sessionWishlistKeysAsync(prof.key)
+        attend_keys = attend_future.get_result()
+        wish_keys = wish_future.get_result()
+        c_keys = set(attend_keys)
+        c_keys.update(s_key.parent() for s_key in wish_keys)
+        versions.update(self._cacheVersions(
+            [MEMCACHE_CONFERENCE_VERSION_KEY % c_key.urlsafe()
+             for c_key in c_keys]))
+        conf_future = ndb.get_multi_async(attend_keys)
+        sess_future = ndb.get_multi_async(wish_keys)
+        conferences = ConferenceForms(items=self._copyConferencesToForms(
+            [f.get_result() for f in conf_future if f.get_result()]))
+        sessions = self._copySessionsToForms(
+            [f.get_result() for f in sess_future])
+        memcache.set(skey, (versions,
+                            protojson.encode_message(conferences),
+                            protojson.encode_message(sessions)))
+        return conferences, sessions
 
     @endpoints.method(
         CONF_GET_REQUEST, BooleanMessage,
@@ -1076,6 +1921,268 @@ class ConferenceApi(remote.Service):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
 
+    @staticmethod
+    def _getOrganizedConference(wsck, user_id):
+        """Return the conference with websafe key wsck, checking that the
+        user organizes it."""
+        c_key = ConferenceApi._conferenceKeyOrNone(wsck)
+        conf = c_key.get() if c_key else None
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the organizer can see the attendees.')
+        return conf
+
+    @staticmethod
+    def _attendeePages(c_key, page_size, websafeCursor=None, pages=None):
+        """Yield ([(Profile, group seats)], next websafe cursor) for each
+        page of the conference's attendees, up to pages pages: first the
+        registered users, then those who only hold group seats. The
+        Profiles and GroupBookings of a page are fetched with one get_multi
+        while the keys of the next page are queried, and only one page is
+        held at a time."""
+        group = (websafeCursor or '').startswith(GROUP_CURSOR_PREFIX)
+        if group:
+            websafeCursor = websafeCursor[len(GROUP_CURSOR_PREFIX):]
+        try:
+            cursor = Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException(
+                'Invalid websafeCursor: %s' % websafeCursor)
+
+        def pageKeys(group, cursor):
+            if group:
+                return groupBookerKeysAsync(c_key, page_size, cursor)
+            return attendeeKeysAsync(c_key, page_size, cursor)
+
+        keys_future = pageKeys(group, cursor)
+        while True:
+            p_keys, cursor, more = keys_future.get_result()
+            more = more and cursor is not None
+            if pages is not None:
+                pages -= 1
+            keys = p_keys + [groupBookingKey(p_key, c_key) for p_key in p_keys]
+            if group:
+                # group holders who also registered were listed already
+                keys.extend(attendanceKey(p_key, c_key) for p_key in p_keys)
+            entities_future = ndb.get_multi_async(keys)
+            next_group = group
+            if not more and not group:
+                # the group holders follow the registered users
+                keys_future = pageKeys(True, None)
+                more = bool(keys_future.get_result()[0])
+                next_group, cursor = True, None
+            elif more and pages != 0:
+                keys_future = pageKeys(group, cursor)
+            entities = [f.get_result() for f in entities_future]
+            count = len(p_keys)
+            registered = entities[2 * count:] or [None] * count
+            rows = [(prof, booking.seats if booking else 0)
+                    for prof, booking, attendance in zip(
+                        entities[:count], entities[count:2 * count],
+                        registered)
+                    if prof and not attendance]
+            next_cursor = None
+            if more:
+                next_cursor = (GROUP_CURSOR_PREFIX if next_group else '') + \
+                    (cursor.urlsafe() if cursor else '')
+            yield rows, next_cursor
+            if not more or pages == 0:
+                return
+            group = next_group
+
+    @endpoints.method(
+        ATTENDEES_GET_REQUEST, AttendeeForms,
+        path='conference/{websafeConferenceKey}/attendees',
+        http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Return one page of the conference's attendees, with the group
+        seats each holds; organizer only."""
+        user = currentUser()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        conf = self._getOrganizedConference(
+            request.websafeConferenceKey, currentUserId())
+
+        page_size = request.pageSize or QUERY_PAGE_SIZE
+        if page_size < 1 or page_size > QUERY_MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'pageSize must be between 1 and %d.' % QUERY_MAX_PAGE_SIZE)
+        rows, websafeCursor = next(self._attendeePages(
+            conf.key, page_size, request.websafeCursor, pages=1))
+        items = []
+        for prof, seats in rows:
+            form = ATTENDEE_PLAN.copy(prof, validate=False)
+            form.groupSeats = seats
+            items.append(form)
+        return AttendeeForms(items=items, nextWebsafeCursor=websafeCursor)
+
+    @staticmethod
+    def _conferenceKeyOrNone(wsck):
+        """Return the Conference key for a websafe key, or None if it is
+        not a valid Conference key."""
+        try:
+            c_key = ndb.Key(urlsafe=wsck)
+        except (TypeError, ValueError, ProtocolBufferDecodeError):
+            return None
+        if c_key.kind() != 'Conference':
+            return None
+        return c_key
+
+    @ndb.transactional(xg=True)
+    def _reserveGroupSeats(self, p_key, conf, count):
+        """Take count seats from the conference's shards, all or nothing,
+        and record them in the profile's GroupBooking for the conference.
+        Returns False if fewer than count seats are left; raises
+        ConflictException past GROUP_SEATS_MAX booked seats."""
+        b_key = groupBookingKey(p_key, conf.key)
+        booking = b_key.get() or GroupBooking(
+            key=b_key, conferenceKey=conf.key)
+        if booking.seats + count > GROUP_SEATS_MAX:
+            raise ConflictException(
+                'At most %d group seats per user and conference.' %
+                GROUP_SEATS_MAX)
+        shards = takeSeats(conf, count)
+        if shards is None:
+            return False
+        booking.seats += count
+        ndb.put_multi([booking] + shards)
+        return True
+
+    @ndb.transactional(xg=True)
+    def _releaseGroupSeats(self, p_key, conf, count=None):
+        """Give count seats of the profile's GroupBooking for the conference,
+        or all of them, back to a random shard; the booking is deleted once
+        it holds no seats. Returns (the updated shard, seats given back), or
+        (None, 0) if the user holds no group seats."""
+        b_key = groupBookingKey(p_key, conf.key)
+        booking, shard = ndb.get_multi([b_key, randomShardKey(conf)])
+        if not booking or not booking.seats:
+            return None, 0
+        count = min(count or booking.seats, booking.seats)
+        booking.seats -= count
+        shard.seatsAvailable += count
+        if booking.seats:
+            ndb.put_multi([booking, shard])
+        else:
+            b_key.delete()
+            shard.put()
+        return shard, count
+
+    @endpoints.method(
+        GROUP_RELEASE_REQUEST, BooleanMessage,
+        path='conference/{websafeConferenceKey}/group',
+        http_method='DELETE', name='unregisterGroup')
+    def unregisterGroup(self, request):
+        """Give back the user's group seats for a conference, or only seats
+        of them."""
+        if request.seats is not None and request.seats < 1:
+            raise endpoints.BadRequestException("'seats' must be > 0.")
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        c_key = self._conferenceKeyOrNone(wsck)
+        conf = c_key.get() if c_key else None
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        # move conferences created before seat sharding onto shards
+        if not conf.seatShards:
+            conf = self._shardConferenceSeats(c_key)
+        shard, count = self._releaseGroupSeats(prof.key, conf, request.seats)
+        if shard:
+            # seatsAvailable changed; refresh now the transaction committed
+            self._seatChanged(c_key, shard, count)
+        return BooleanMessage(data=bool(shard))
+
+    def _batchRegistration(self, request):
+        """Register user for each selected conference, or reserve seats for
+        a group on one conference; one transaction per conference."""
+        wscks = request.websafeConferenceKeys
+        if not wscks:
+            raise endpoints.BadRequestException(
+                "'websafeConferenceKeys' field required")
+        if len(wscks) > REGISTRATION_BATCH_MAX:
+            raise endpoints.BadRequestException(
+                'At most %d conferences per request.' %
+                REGISTRATION_BATCH_MAX)
+        if request.seats is not None and (request.seats < 1 or
+                                          len(wscks) != 1):
+            raise endpoints.BadRequestException(
+                "Reserving 'seats' requires one conference and seats > 0.")
+        if request.seats and request.seats > GROUP_SEATS_MAX:
+            raise endpoints.BadRequestException(
+                'At most %d seats per group booking.' % GROUP_SEATS_MAX)
+
+        # get user Profile once for all conferences
+        prof = self._getProfileFromUser()
+
+        # get all conferences and their open seat shards in batches
+        c_keys = [self._conferenceKeyOrNone(wsck) for wsck in wscks]
+        unique_keys = list(set(c_key for c_key in c_keys if c_key))
+        confs = dict(zip(unique_keys, ndb.get_multi(unique_keys)))
+        for c_key, conf in confs.items():
+            # move conferences created before seat sharding onto shards
+            if conf and not conf.seatShards:
+                confs[c_key] = self._shardConferenceSeats(c_key)
+        open_keys = openShardKeysMulti(
+            [conf for conf in confs.values() if conf])
+
+        items = []
+        taken = {}
+        for wsck, c_key in zip(wscks, c_keys):
+            result = RegistrationResultForm(
+                websafeConferenceKey=wsck, registered=False)
+            conf = confs.get(c_key)
+            if not conf:
+                result.error = 'No conference found with key: %s' % wsck
+            elif request.seats:
+                # group booking, all seats or none
+                try:
+                    if self._reserveGroupSeats(
+                            prof.key, conf, request.seats):
+                        result.registered = True
+                        result.seats = request.seats
+                    else:
+                        result.error = 'There are not enough seats available.'
+                except ConflictException as e:
+                    result.error = str(e)
+            else:
+                try:
+                    for shard_key in open_keys[c_key]:
+                        shard = self._reserveSeat(prof.key, c_key, shard_key)
+                        if shard:
+                            taken[c_key] = shard
+                            result.registered = True
+                            result.seats = 1
+                            break
+                    else:
+                        result.error = 'There are no seats available.'
+                except ConflictException as e:
+                    result.error = str(e)
+            items.append(result)
+
+        # the user's conferences changed, unless only group seats were taken
+        if not request.seats and any(result.registered for result in items):
+            self._invalidateSchedule(prof.key.id())
+        # seatsAvailable changed; refresh once the transactions committed
+        if request.seats:
+            self._conferenceChanged(list(set(
+                c_key for c_key, result in zip(c_keys, items)
+                if result.registered)))
+        for c_key, shard in taken.items():
+            self._seatChanged(c_key, shard, -1)
+        return RegistrationResultForms(items=items)
+
+    @endpoints.method(
+        RegistrationForm, RegistrationResultForms,
+        path='conferences/register', http_method='POST',
+        name='registerForConferences')
+    def registerForConferences(self, request):
+        """Register user for many conferences, or reserve seats on one."""
+        return self._batchRegistration(request)
+
     @endpoints.method(
         message_types.VoidMessage, ConferenceForms, path='filterPlayground',
         http_method='GET', name='filterPlayground')
@@ -1095,5 +2202,5 @@ class ConferenceApi(remote.Service):
         return ConferenceForms(
             items=[self._copyConferenceToForm(conf, "") for conf in q])
 
-# registers API
-api = endpoints.api_server([ConferenceApi])
+# registers API; admins can profile a request with an X-Profile header
+api = profiled(endpoints.api_server([ConferenceApi]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""identity.py
+
+Conference server-side Python App Engine request-scoped identity
+
+Resolves the signed-in user, their user id and Profile once per request,
+however many code paths ask for them. The context lives in a thread local
+tagged with the request's log id, so a thread serving a new request never
+sees the previous request's user; without a request id (eg in scripts)
+nothing is kept.
+
+"""
+
+import os
+import threading
+
+import endpoints
+
+from utils import getUserId
+
+_local = threading.local()
+
+
+class RequestContext(object):
+    """RequestContext -- identity resolved for the current request"""
+
+    def __init__(self, requestId):
+        self.requestId = requestId
+        self.resolved = False
+        self.user = None
+        self.userId = None
+        self.profile = None
+
+
+def current():
+    """Return the RequestContext of the current request."""
+    requestId = os.environ.get('REQUEST_LOG_ID')
+    context = getattr(_local, 'context', None)
+    if requestId is None or context is None or \
+            context.requestId != requestId:
+        context = RequestContext(requestId)
+        _local.context = context
+    return context
+
+
+def _resolve():
+    """Return the current context with the user resolved."""
+    context = current()
+    if not context.resolved:
+        context.user = endpoints.get_current_user()
+        if context.user:
+            context.userId = getUserId(context.user)
+        context.resolved = True
+    return context
+
+
+def currentUser():
+    """Return the signed-in endpoints user, or None."""
+    return _resolve().user
+
+
+def currentUserId():
+    """Return the user id of the signed-in user, or None."""
+    return _resolve().userId
+
+
+def currentProfile():
+    """Return the Profile already loaded in this request, or None."""
+    return current().profile
+
+
+def setCurrentProfile(profile):
+    """Keep the user's Profile for the rest of the request."""
+    current().profile = profile
@@ -1,9 +1,25 @@
 #!/usr/bin/env python
 
+import csv
+import json
+import threading
+import time
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
+from google.appengine.api import taskqueue
+from google.appengine.api import users
+from google.appengine.ext import ndb
+import endpoints
 from conference import ConferenceApi
+from conference import EXPORT_PAGE_SIZE
+from utils import getUserId
+from profiler import profiled
+from rpcstats import instrumentHandlers
+import changes
+import profiler
+import rpcstats
 
 """
 main.py -- Udacity conference server-side Python App Engine
@@ -17,6 +33,17 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+# a held /changes request keeps an instance thread and reads memcache every
+# CHANGES_POLL seconds; at most CHANGES_MAX_HELD are held per instance, and
+# clients past that are answered at once and asked to come back later
+CHANGES_WAIT = 10
+CHANGES_POLL = 1
+CHANGES_MAX_HELD = 8
+CHANGES_RETRY_MS = 1000
+CHANGES_BUSY_RETRY_MS = 10000
+
+_changesHeld = threading.BoundedSemaphore(CHANGES_MAX_HELD)
+
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
@@ -27,12 +54,179 @@ class SetAnnouncementHandler(webapp2.RequestHandler):
 
 class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
     def post(self):
-        """Set Featured Speaker."""
-        websafeSessionKey = self.request.get('websafeSessionKey')
-        ConferenceApi._setFeaturedSpeaker(websafeSessionKey)
+        """Set Featured Speaker, for a new session or a whole conference."""
+        websafeConferenceKey = self.request.get('websafeConferenceKey')
+        if websafeConferenceKey:
+            ConferenceApi._setConferenceFeaturedSpeaker(websafeConferenceKey)
+        else:
+            websafeSessionKey = self.request.get('websafeSessionKey')
+            ConferenceApi._setFeaturedSpeaker(websafeSessionKey)
         self.response.set_status(204)
 
 
+def backfillHandler(page):
+    """Return a handler running a backfill in chained tasks at its own URL.
+    A GET queues the first task; each task calls page with its
+    websafeCursor to work through one page, and queues the next page with
+    the cursor page returns, until it returns None."""
+    class BackfillHandler(webapp2.RequestHandler):
+        def get(self):
+            """Start the backfill."""
+            taskqueue.add(url=self.request.path)
+            self.response.set_status(202)
+
+        def post(self):
+            """Backfill one page and queue the next page."""
+            websafeCursor = page(self.request.get('websafeCursor') or None)
+            if websafeCursor:
+                taskqueue.add(params={
+                    'websafeCursor': websafeCursor},
+                    url=self.request.path
+                )
+            self.response.set_status(204)
+    return BackfillHandler
+
+
+class UpdateOrganizerNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy a renamed organizer's displayName onto their conferences."""
+        ConferenceApi._updateOrganizerDisplayName(self.request.get('userId'))
+        self.response.set_status(204)
+
+
+class IndexSpeakerCitiesHandler(webapp2.RequestHandler):
+    def post(self):
+        """Index a conference's speakers under its (new) city."""
+        ConferenceApi._indexSpeakerCities(
+            ndb.Key(urlsafe=self.request.get('websafeConferenceKey')),
+            self.request.get('oldCity') or None)
+        self.response.set_status(204)
+
+
+class IndexDocumentsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Update the search index for conferences and sessions."""
+        ConferenceApi._indexDocuments(
+            [ndb.Key(urlsafe=websafeKey) for websafeKey
+             in self.request.get('websafeKeys').split(',') if websafeKey])
+        self.response.set_status(204)
+
+
+class ExportAttendeesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Write the attendees of a conference as CSV, for its organizer,
+        a page of profiles at a time."""
+        wsck = self.request.get('websafeConferenceKey')
+        try:
+            conf = ConferenceApi._getOrganizedConference(
+                wsck, getUserId(users.get_current_user()))
+        except endpoints.NotFoundException as e:
+            self.abort(404, detail=str(e))
+        except endpoints.ForbiddenException as e:
+            self.abort(403, detail=str(e))
+
+        self.response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+        self.response.headers['Content-Disposition'] = (
+            'attachment; filename="attendees-%s.csv"' % conf.key.id())
+        writer = csv.writer(self.response.out)
+        writer.writerow(
+            ['displayName', 'mainEmail', 'teeShirtSize', 'groupSeats'])
+        for rows, _ in ConferenceApi._attendeePages(
+                conf.key, EXPORT_PAGE_SIZE):
+            writer.writerows(
+                [(prof.displayName or u'').encode('utf-8'),
+                 (prof.mainEmail or u'').encode('utf-8'),
+                 prof.teeShirtSize, seats] for prof, seats in rows)
+
+
+class ChangesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Long-poll the change log: hold the request until there are events
+        after the client's last event id, then return them as JSON, or as
+        Server-Sent Events for an EventSource client."""
+        sse = 'text/event-stream' in self.request.headers.get('Accept', '')
+        websafeConferenceKey = self.request.get('websafeConferenceKey') or None
+        # new subscribers start from the latest events
+        since = changes.parseCursor(
+            self.request.headers.get('Last-Event-ID') or
+            self.request.get('since'), websafeConferenceKey)
+
+        retry = CHANGES_RETRY_MS
+        if since is None:
+            events, last, complete = [], changes.latest(
+                websafeConferenceKey), True
+        elif not _changesHeld.acquire(False):
+            # enough requests are held on this instance already
+            events, last, complete = changes.read(since, websafeConferenceKey)
+            retry = CHANGES_BUSY_RETRY_MS
+        else:
+            try:
+                deadline = time.time() + CHANGES_WAIT
+                while True:
+                    events, last, complete = changes.read(
+                        since, websafeConferenceKey)
+                    if events or not complete or time.time() >= deadline:
+                        break
+                    since = last
+                    time.sleep(CHANGES_POLL)
+            finally:
+                _changesHeld.release()
+
+        last = changes.formatCursor(last)
+        self.response.headers['Cache-Control'] = 'no-cache'
+        if not sse:
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps(
+                {'last': last, 'reset': not complete, 'events': events,
+                 'retryMs': retry}))
+            return
+        # App Engine sends the response once the handler returns, so each
+        # response carries one batch and EventSource reconnects after
+        # retry ms with the cursor of the batch as Last-Event-ID
+        self.response.headers['Content-Type'] = 'text/event-stream'
+        self.response.write('retry: %d\n\n' % retry)
+        for event in events:
+            self.response.write('event: %s\ndata: %s\n\n' % (
+                event['kind'], json.dumps(event)))
+        if not complete:
+            self.response.write('event: reset\ndata: {}\n\n')
+        # an id without data sets the client's Last-Event-ID to the cursor
+        # after the whole batch without dispatching anything
+        self.response.write('id: %s\n\n' % last)
+
+
+class StatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return the RPC & latency stats of every endpoint method and
+        handler as JSON, busiest first."""
+        # include this instance's calls not flushed yet
+        rpcstats.flush()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.headers['Cache-Control'] = 'no-cache'
+        self.response.write(json.dumps(
+            {'methods': rpcstats.statistics()}, indent=2, sort_keys=True))
+
+
+class ProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return a stored request profile by id as JSON, or the list of
+        recent ones without an id."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.headers['Cache-Control'] = 'no-cache'
+        seq = self.request.get('id')
+        if not seq:
+            self.response.write(json.dumps(
+                {'profiles': profiler.recent()}, indent=2))
+            return
+        try:
+            entry = profiler.get(int(seq))
+        except ValueError:
+            entry = None
+        if not entry:
+            self.abort(404, detail='No profile found with id: %s' % seq)
+        self.response.write(json.dumps(entry, indent=2, sort_keys=True))
+
+
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
         """Send email confirming Conference creation."""
@@ -47,8 +241,28 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
         )
 
 
-app = webapp2.WSGIApplication([
+# admins can profile a request with an X-Profile header or profile=1
+app = profiled(webapp2.WSGIApplication(instrumentHandlers([
+    ('/admin/profiles', ProfilesHandler),
+    ('/admin/stats', StatsHandler),
+    ('/changes', ChangesHandler),
+    ('/export/attendees', ExportAttendeesHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
-    ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler)
-], debug=True)
+    ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
+    ('/tasks/update_organizer_name', UpdateOrganizerNameHandler),
+    ('/tasks/backfill_organizer_names', backfillHandler(
+        ConferenceApi._backfillOrganizerDisplayNames)),
+    ('/tasks/index_speaker_cities', IndexSpeakerCitiesHandler),
+    ('/tasks/backfill_speaker_cities', backfillHandler(
+        ConferenceApi._backfillSpeakerCities)),
+    ('/tasks/migrate_memberships', backfillHandler(
+        ConferenceApi._backfillMemberships)),
+    ('/tasks/backfill_speaker_directory', backfillHandler(
+        ConferenceApi._backfillSpeakerDirectory)),
+    ('/tasks/index_documents', IndexDocumentsHandler),
+    ('/tasks/backfill_search_index', backfillHandler(
+        ConferenceApi._backfillSearchIndex)),
+    ('/tasks/sweep_low_seats', backfillHandler(
+        ConferenceApi._sweepLowSeats))
+]), debug=True))
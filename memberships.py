@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""memberships.py
+
+Conference server-side Python App Engine conference attendance & session
+wishlist membership entities
+
+Each registration is an Attendance and each wishlist session a
+WishlistEntry, a child of the Profile keyed by the websafe key of the
+conference or session. Checking a membership is a get by key, changing one
+writes one small entity instead of the whole Profile, and the indexed
+conferenceKey & sessionKey answer who attends a conference. Group seats are
+held in a GroupBooking, keyed the same way.
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import Attendance
+from models import GroupBooking
+from models import WishlistEntry
+
+
+def attendanceKey(p_key, c_key):
+    """Return the key of the profile's Attendance of a conference."""
+    return ndb.Key(Attendance, c_key.urlsafe(), parent=p_key)
+
+
+def groupBookingKey(p_key, c_key):
+    """Return the key of the profile's GroupBooking of a conference."""
+    return ndb.Key(GroupBooking, c_key.urlsafe(), parent=p_key)
+
+
+def wishlistKey(p_key, s_key):
+    """Return the key of the profile's WishlistEntry for a session."""
+    return ndb.Key(WishlistEntry, s_key.urlsafe(), parent=p_key)
+
+
+@ndb.tasklet
+def conferenceKeysToAttendAsync(p_key):
+    """Return a future for the keys of the conferences the profile
+    attends, read from the Attendance key names with a strongly
+    consistent keys-only ancestor query."""
+    keys = yield Attendance.query(ancestor=p_key).fetch_async(keys_only=True)
+    raise ndb.Return([ndb.Key(urlsafe=key.id()) for key in keys])
+
+
+@ndb.tasklet
+def sessionWishlistKeysAsync(p_key):
+    """Return a future for the keys of the sessions on the profile's
+    wishlist."""
+    keys = yield WishlistEntry.query(ancestor=p_key).fetch_async(
+        keys_only=True)
+    raise ndb.Return([ndb.Key(urlsafe=key.id()) for key in keys])
+
+
+@ndb.tasklet
+def attendeeKeysAsync(c_key, page_size, start_cursor=None):
+    """Return a future for (profile keys, cursor, more) of one page of the
+    conference's attendees, from a keys-only query on
+    Attendance.conferenceKey."""
+    keys, cursor, more = yield Attendance.query(
+        Attendance.conferenceKey == c_key).fetch_page_async(
+        page_size, start_cursor=start_cursor, keys_only=True)
+    raise ndb.Return(([key.parent() for key in keys], cursor, more))
+
+
+@ndb.tasklet
+def groupBookerKeysAsync(c_key, page_size, start_cursor=None):
+    """Return a future for (profile keys, cursor, more) of one page of the
+    profiles holding group seats of the conference, from a keys-only query
+    on GroupBooking.conferenceKey."""
+    keys, cursor, more = yield GroupBooking.query(
+        GroupBooking.conferenceKey == c_key).fetch_page_async(
+        page_size, start_cursor=start_cursor, keys_only=True)
+    raise ndb.Return(([key.parent() for key in keys], cursor, more))
+
+
+def fromProfile(prof):
+    """Return (unsaved) Attendance and WishlistEntry entities for the
+    memberships still held in the profile's repeated properties."""
+    return [Attendance(key=attendanceKey(prof.key, c_key),
+                       conferenceKey=c_key)
+            for c_key in prof.conferenceKeysToAttend] + \
+        [WishlistEntry(key=wishlistKey(prof.key, s_key), sessionKey=s_key)
+         for s_key in prof.sessionWishlistKeys]
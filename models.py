@@ -38,6 +38,7 @@ class Conference(ndb.Model):
     name = ndb.StringProperty(required=True)
     description = ndb.StringProperty()
     organizerUserId = ndb.StringProperty()
+    organizerDisplayName = ndb.StringProperty()
     topics = ndb.StringProperty(repeated=True)
     city = ndb.StringProperty()
     startDate = ndb.DateProperty()
@@ -45,6 +46,27 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    seatShards = ndb.IntegerProperty(default=0)
+
+
+class SeatShard(ndb.Model):
+    """SeatShard -- one shard of a Conference's available seats"""
+    conferenceKey = ndb.KeyProperty(Conference, required=True)
+    seatsAvailable = ndb.IntegerProperty(default=0)
+
+
+class LowSeats(ndb.Model):
+    """LowSeats -- index of the conferences that are nearly sold out, with
+    their names in the same order; a single entity keyed LOW_SEATS"""
+    conferenceKeys = ndb.KeyProperty(Conference, repeated=True, indexed=False)
+    names = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class GroupBooking(ndb.Model):
+    """GroupBooking -- seats reserved by a Profile for a group, keyed by the
+    websafe conference key with the Profile as parent"""
+    conferenceKey = ndb.KeyProperty(Conference, required=True)
+    seats = ndb.IntegerProperty(default=0)
 
 
 class ConferenceForm(messages.Message):
@@ -66,6 +88,27 @@ class ConferenceForm(messages.Message):
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextWebsafeCursor = messages.StringField(2)
+
+
+class RegistrationForm(messages.Message):
+    """RegistrationForm -- batch registration inbound form message; either
+    registers the user for each conference, or reserves seats on one"""
+    websafeConferenceKeys = messages.StringField(1, repeated=True)
+    seats = messages.IntegerField(2)
+
+
+class RegistrationResultForm(messages.Message):
+    """RegistrationResultForm -- outbound result of one registration"""
+    websafeConferenceKey = messages.StringField(1)
+    registered = messages.BooleanField(2)
+    seats = messages.IntegerField(3)
+    error = messages.StringField(4)
+
+
+class RegistrationResultForms(messages.Message):
+    """RegistrationResultForms -- multiple registration results"""
+    items = messages.MessageField(RegistrationResultForm, 1, repeated=True)
 
 
 class Speaker(ndb.Model):
@@ -75,6 +118,13 @@ class Speaker(ndb.Model):
     bio = ndb.StringProperty()
 
 
+class SpeakerName(ndb.Model):
+    """SpeakerName -- speaker directory entry, keyed by the speaker's
+    displayName normalized by speakers.normalizeName"""
+    speakerKey = ndb.KeyProperty(Speaker, required=True, indexed=False)
+    displayName = ndb.StringProperty(indexed=False)
+
+
 class SpeakerForm(messages.Message):
     """SpeakerForm -- Speaker outbound form message"""
     displayName = messages.StringField(1)
@@ -119,6 +169,8 @@ class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound
     form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    websafeCursor = messages.StringField(3)
 
 
 class Session(ndb.Model):
@@ -133,6 +185,62 @@ class Session(ndb.Model):
     conferenceKey = ndb.ComputedProperty( lambda self: self.key.parent() )
 
 
+class SpeakerSessions(ndb.Model):
+    """SpeakerSessions -- running tally of one speaker's sessions in a
+    conference, keyed by the websafe speaker key with the Conference as
+    parent"""
+    speakerKey = ndb.KeyProperty(Speaker, required=True)
+    sessionKeys = ndb.KeyProperty(Session, repeated=True, indexed=False)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+    sessionCount = ndb.IntegerProperty(default=0)
+
+
+class SpeakerCity(ndb.Model):
+    """SpeakerCity -- the conferences in a city where a speaker has
+    sessions, keyed by the websafe speaker key and the city joined by ':'"""
+    city = ndb.StringProperty(required=True)
+    speakerKey = ndb.KeyProperty(Speaker, required=True, indexed=False)
+    conferenceKeys = ndb.KeyProperty(Conference, repeated=True, indexed=False)
+
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- featured speaker announcement of a conference,
+    keyed FEATURED with the Conference as parent"""
+    speakerKey = ndb.KeyProperty(Speaker)
+    announcement = ndb.TextProperty()
+
+
+class Posting(ndb.Model):
+    """Posting -- weight of a term in a Conference or Session, keyed by the
+    term and the websafe document key"""
+    term = ndb.StringProperty(required=True)
+    kind = ndb.StringProperty(required=True)
+    docKey = ndb.KeyProperty(required=True, indexed=False)
+    weight = ndb.FloatProperty(default=0.0)
+
+
+class DocTerms(ndb.Model):
+    """DocTerms -- terms a Conference or Session is indexed under, keyed by
+    the websafe document key"""
+    terms = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class SearchResultForm(messages.Message):
+    """SearchResultForm -- one search result outbound form message"""
+    kind = messages.StringField(1)
+    websafeKey = messages.StringField(2)
+    name = messages.StringField(3)
+    score = messages.FloatField(4)
+
+
+class SearchResultForms(messages.Message):
+    """SearchResultForms -- one page of search results outbound form
+    message"""
+    items = messages.MessageField(SearchResultForm, 1, repeated=True)
+    total = messages.IntegerField(2)
+    nextOffset = messages.IntegerField(3)
+
+
 class SessionForm(messages.Message):
     """SessionForm -- Session outbound form message"""
     name = messages.StringField(1)
@@ -158,10 +266,38 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
+    # legacy memberships, moved to Attendance & WishlistEntry on first use
     conferenceKeysToAttend = ndb.KeyProperty(Conference, repeated=True)
     sessionWishlistKeys = ndb.KeyProperty(Session, repeated=True)
 
 
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- conference attendee outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
+    groupSeats = messages.IntegerField(4)
+
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- one page of conference attendees outbound form
+    message"""
+    items = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextWebsafeCursor = messages.StringField(2)
+
+
+class Attendance(ndb.Model):
+    """Attendance -- a Profile's registration for a Conference, keyed by
+    the websafe conference key with the Profile as parent"""
+    conferenceKey = ndb.KeyProperty(Conference, required=True)
+
+
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- a Session on a Profile's wishlist, keyed by the
+    websafe session key with the Profile as parent"""
+    sessionKey = ndb.KeyProperty(Session, required=True)
+
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName = messages.StringField(1)
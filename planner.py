@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""planner.py
+
+Conference server-side Python App Engine query planner
+
+Chooses how to run a query with user supplied filters against the indexes
+declared in index.yaml. The most selective set of filters that a built-in
+or declared index can serve is pushed to the datastore; the other filters
+(inequalities on further properties, !=, repeated equalities) are applied
+in memory to the entities of a keys-only scan of the pushed query. Any
+filter set can then be run without a missing index error. If index.yaml
+cannot be read, only built-in indexes are used.
+
+"""
+
+import itertools
+import logging
+import operator
+import os
+
+import yaml
+
+from google.appengine.ext import ndb
+
+INDEX_YAML = os.path.join(os.path.dirname(__file__), 'index.yaml')
+BUILT_IN = 'built-in'
+SCAN_BATCH = 50
+
+# rough share of entities let through by a filter, used to rank plans
+SELECTIVITY = {
+    '=': 0.1,
+    '<': 0.5,
+    '<=': 0.5,
+    '>': 0.5,
+    '>=': 0.5,
+}
+
+COMPARE = {
+    '=': operator.eq,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def loadIndexes(kind, path=INDEX_YAML):
+    """Return the ascending, non-ancestor composite indexes declared for
+    kind, as tuples of property names; none if the file is missing or
+    malformed, so queries fall back to built-in indexes."""
+    try:
+        with open(path) as f:
+            declared = (yaml.safe_load(f) or {}).get('indexes') or []
+    except (IOError, AttributeError, yaml.YAMLError) as e:
+        logging.error('Cannot read indexes from %s: %s', path, e)
+        return set()
+    indexes = set()
+    for index in declared:
+        if index.get('kind') != kind or index.get('ancestor'):
+            continue
+        props = index.get('properties') or []
+        if all(p.get('direction', 'asc') == 'asc' for p in props):
+            indexes.add(tuple(p['name'] for p in props))
+    return indexes
+
+
+class Predicate(object):
+    """Predicate -- a property, operator & value filter"""
+
+    def __init__(self, prop, op, value, repeated=False):
+        self.prop = prop
+        self.op = op
+        self.value = value
+        self.repeated = repeated
+
+    def matches(self, entity):
+        """Apply the filter to an entity in memory. Like the datastore, a
+        repeated property matches if any of its values does, except for
+        != which requires that none of its values is equal."""
+        value = getattr(entity, self.prop, None)
+        values = [v for v in (value if self.repeated else [value])
+                  if v is not None]
+        if self.op == '!=':
+            return self.value not in values
+        return any(COMPARE[self.op](v, self.value) for v in values)
+
+    def node(self):
+        """Return the filter as a datastore query FilterNode."""
+        return ndb.query.FilterNode(self.prop, self.op, self.value)
+
+    def __str__(self):
+        return '%s %s %r' % (self.prop, self.op, self.value)
+
+
+class QueryPlan(object):
+    """QueryPlan -- filters pushed to the datastore, the index serving
+    them, the sort order & the filters applied in memory"""
+
+    def __init__(self, model, index, pushed, orders, residual):
+        self.model = model
+        self.index = index
+        self.pushed = pushed
+        self.orders = orders
+        self.residual = residual
+        self.selectivity = 1.0
+        for pred in pushed:
+            self.selectivity *= SELECTIVITY[pred.op]
+
+    def query(self):
+        """Return the datastore query of the pushed filters."""
+        q = self.model.query()
+        for pred in self.pushed:
+            q = q.filter(pred.node())
+        for prop in self.orders:
+            q = q.order(self.model._properties[prop])
+        return q
+
+    def matches(self, entity):
+        """Apply the in-memory filters to an entity."""
+        return all(pred.matches(entity) for pred in self.residual)
+
+    def fetchPage(self, page_size, start_cursor=None, max_scan=1000):
+        """Return (entities, cursor, more) like Query.fetch_page. With
+        in-memory filters, keys are scanned from the pushed query and their
+        entities filtered until page_size match or max_scan keys were
+        scanned; the cursor then points after the last entity examined."""
+        q = self.query()
+        if not self.residual:
+            return q.fetch_page(page_size, start_cursor=start_cursor)
+
+        it = q.iter(keys_only=True, start_cursor=start_cursor,
+                    produce_cursors=True, batch_size=SCAN_BATCH)
+        matches, cursor, scanned = [], start_cursor, 0
+        while len(matches) < page_size and scanned < max_scan:
+            keys, cursors = [], []
+            while len(keys) < min(SCAN_BATCH, max_scan - scanned) and \
+                    it.has_next():
+                keys.append(it.next())
+                cursors.append(it.cursor_after())
+            if not keys:
+                return matches, cursor, False
+            scanned += len(keys)
+            for i, entity in enumerate(ndb.get_multi(keys)):
+                cursor = cursors[i]
+                if entity and self.matches(entity):
+                    matches.append(entity)
+                    if len(matches) == page_size:
+                        if i < len(keys) - 1:
+                            return matches, cursor, True
+                        break
+        return matches, cursor, it.has_next()
+
+    def explain(self):
+        """Describe the plan, one aspect per line."""
+        if self.index != BUILT_IN:
+            index = '%s(%s)' % (self.model._get_kind(), ', '.join(self.index))
+        elif len(self.pushed) > 1 and not self.orders:
+            index = 'built-in, merge join'
+        else:
+            index = 'built-in'
+        return '\n'.join([
+            'index: %s' % index,
+            'datastore filters: %s' % (
+                ', '.join(str(pred) for pred in self.pushed) or 'none'),
+            'order: %s' % (', '.join(self.orders) or 'key'),
+            'in-memory filters: %s' % (
+                ', '.join(str(pred) for pred in self.residual) or 'none'),
+            'estimated selectivity: %.3g' % self.selectivity,
+        ])
+
+
+class QueryPlanner(object):
+    """QueryPlanner -- picks the QueryPlan for a set of filters on a model"""
+
+    def __init__(self, model, indexes, order=None):
+        """Args:    model: ndb.Model class to query
+                    indexes: composite indexes, from loadIndexes
+                    order: property to sort results on, where an index
+                        allows it
+        """
+        self.model = model
+        self.indexes = indexes
+        self.order = order
+
+    def indexFor(self, eq_props, orders):
+        """Return the index serving equality filters on eq_props sorted by
+        orders: BUILT_IN, a declared composite index, or None."""
+        if not orders or (not eq_props and len(orders) == 1):
+            return BUILT_IN
+        n = len(eq_props)
+        for index in self.indexes:
+            if len(index) == n + len(orders) and \
+                    set(index[:n]) == set(eq_props) and \
+                    list(index[n:]) == orders:
+                return index
+
+    def plan(self, predicates):
+        """Return the QueryPlan pushing the most selective index-backed
+        filters to the datastore, preferring plans sorted on self.order."""
+        # one equality filter per property can use an index
+        eqs = {}
+        ranges = {}
+        for pred in predicates:
+            if pred.op == '=':
+                eqs.setdefault(pred.prop, pred)
+            elif pred.op in SELECTIVITY:
+                ranges.setdefault(pred.prop, []).append(pred)
+
+        best, best_rank = None, None
+        for n in range(len(eqs) + 1):
+            for eq_props in itertools.combinations(sorted(eqs), n):
+                for ineq in [None] + sorted(ranges):
+                    if ineq in eq_props:
+                        continue
+                    for sort in (True, False):
+                        orders = [ineq] if ineq else []
+                        if sort:
+                            if not self.order or self.order in eq_props:
+                                continue
+                            if self.order != ineq:
+                                orders.append(self.order)
+                        index = self.indexFor(eq_props, orders)
+                        if index is None:
+                            continue
+                        pushed = [eqs[p] for p in eq_props] + \
+                            ranges.get(ineq, [])
+                        residual = [pred for pred in predicates
+                                    if pred not in pushed]
+                        plan = QueryPlan(self.model, index, pushed, orders,
+                                         residual)
+                        rank = (plan.selectivity, not sort, len(residual))
+                        if best_rank is None or rank < best_rank:
+                            best, best_rank = plan, rank
+        return best
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""profiler.py
+
+Conference server-side Python App Engine on-demand request profiler
+
+WSGI middleware that runs a request under cProfile when it carries an
+X-Profile header or a profile query parameter and comes from an
+administrator. The PROFILE_TOP functions with the highest cumulative time,
+each with its PROFILE_CALLERS costliest callers, are kept in memcache for
+PROFILE_TTL seconds under consecutive sequence numbers, like the change
+log. The response's X-Profile-Id header gives the number to fetch from
+/admin/profiles. Requests without the flag pass straight through.
+
+"""
+
+import cgi
+import cProfile
+import pstats
+import time
+
+import endpoints
+from google.appengine.api import memcache
+from google.appengine.api import oauth
+from google.appengine.api import users
+
+MEMCACHE_PROFILES_SEQ_KEY = 'PROFILES_SEQ'
+MEMCACHE_PROFILE_KEY = 'PROFILE:%d'
+PROFILE_TTL = 3600
+PROFILE_TOP = 40
+PROFILE_CALLERS = 3
+PROFILES_MAX = 20
+PROFILE_FLAGS = ('1', 'true')
+
+
+def _flagged(environ):
+    """Return True if the request asks to be profiled, with an X-Profile
+    header or profile query parameter of 1 or true."""
+    flag = environ.get('HTTP_X_PROFILE')
+    if flag is None:
+        query = environ.get('QUERY_STRING', '')
+        if 'profile' not in query:
+            return False
+        flag = cgi.parse_qs(query).get('profile', [''])[0]
+    return flag.strip().lower() in PROFILE_FLAGS
+
+
+def _isAdmin(environ):
+    """Return True if the request is made by an administrator, signed in
+    with a cookie or with an OAuth token."""
+    if users.is_current_user_admin():
+        return True
+    if not environ.get('HTTP_AUTHORIZATION'):
+        return False
+    try:
+        return oauth.is_current_user_admin(endpoints.EMAIL_SCOPE)
+    except oauth.Error:
+        return False
+
+
+def _label(func):
+    """Return 'file:line(function)' for a pstats function tuple."""
+    return '%s:%d(%s)' % func
+
+
+def _summary(profile):
+    """Return the top PROFILE_TOP functions of a profile by cumulative
+    time, with their costliest callers."""
+    stats = pstats.Stats(profile)
+    top = sorted(stats.stats.items(), key=lambda item: -item[1][3])
+    rows = []
+    for func, (primitive, calls, total, cumulative, callers) in \
+            top[:PROFILE_TOP]:
+        # a caller's entry ends with the cumulative time it spent in func
+        costliest = sorted(callers.items(), key=lambda item: -item[1][-1])
+        rows.append({
+            'function': _label(func),
+            'calls': calls,
+            'primitiveCalls': primitive,
+            'totalTime': round(total, 6),
+            'cumulativeTime': round(cumulative, 6),
+            'callers': [_label(caller)
+                        for caller, _ in costliest[:PROFILE_CALLERS]],
+        })
+    return {'totalCalls': stats.total_calls, 'functions': rows}
+
+
+def profiled(app):
+    """Return WSGI app profiling the flagged requests of administrators."""
+    def middleware(environ, start_response):
+        if not _flagged(environ) or not _isAdmin(environ):
+            return app(environ, start_response)
+        seq = memcache.incr(MEMCACHE_PROFILES_SEQ_KEY, initial_value=0)
+        if seq is None:
+            return app(environ, start_response)
+
+        def profiledStartResponse(status, headers, exc_info=None):
+            return start_response(
+                status, headers + [('X-Profile-Id', str(seq))], exc_info)
+
+        def run():
+            # consume the body so lazy responses are profiled too
+            result = app(environ, profiledStartResponse)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        profile = cProfile.Profile()
+        start = time.time()
+        try:
+            return profile.runcall(run)
+        finally:
+            entry = _summary(profile)
+            entry.update({
+                'id': seq,
+                'method': environ.get('REQUEST_METHOD'),
+                'path': environ.get('PATH_INFO'),
+                'time': start,
+                'wallMs': int(round((time.time() - start) * 1000)),
+            })
+            memcache.set(MEMCACHE_PROFILE_KEY % seq, entry, time=PROFILE_TTL)
+    return middleware
+
+
+def get(seq):
+    """Return the stored profile with sequence number seq, or None."""
+    return memcache.get(MEMCACHE_PROFILE_KEY % seq)
+
+
+def recent():
+    """Return the id, method, path, time and wallMs of the last
+    PROFILES_MAX stored profiles still in memcache, newest first."""
+    last = memcache.get(MEMCACHE_PROFILES_SEQ_KEY) or 0
+    seqs = range(last, max(last - PROFILES_MAX, 0), -1)
+    found = memcache.get_multi([MEMCACHE_PROFILE_KEY % seq for seq in seqs])
+    fields = ('id', 'method', 'path', 'time', 'wallMs')
+    return [dict((field, found[MEMCACHE_PROFILE_KEY % seq][field])
+                 for field in fields)
+            for seq in seqs if MEMCACHE_PROFILE_KEY % seq in found]
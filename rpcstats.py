@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""rpcstats.py
+
+Conference server-side Python App Engine per-method RPC & latency stats
+
+Every endpoint method and main.py handler is timed, and an apiproxy hook
+counts the datastore, memcache, taskqueue and urlfetch RPCs it makes, by
+type. Each instance adds up its calls in memory and flushes them to
+memcache counters with one offset_multi at most every FLUSH_INTERVAL
+seconds or FLUSH_CALLS calls, so recording costs no RPC of its own on
+most requests. Counts not yet flushed are lost when an instance shuts
+down, and memcache may evict counters, so the stats are a sample of
+recent traffic rather than an exact total.
+
+"""
+
+import collections
+import functools
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+MEMCACHE_STATS_KEY = 'STATS:'
+FLUSH_INTERVAL = 60
+FLUSH_CALLS = 100
+
+# upper bounds of the latency histogram buckets, in ms
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# RPC type by service and call; other calls of a service count as
+# '<service>' and calls of other services as 'other'
+RPC_TYPES = {
+    ('datastore_v3', 'Get'): 'get',
+    ('datastore_v3', 'RunQuery'): 'query',
+    ('datastore_v3', 'Next'): 'next',
+    ('datastore_v3', 'Put'): 'put',
+    ('datastore_v3', 'Delete'): 'delete',
+    ('datastore_v3', 'BeginTransaction'): 'txn',
+    ('datastore_v3', 'Commit'): 'txn',
+    ('datastore_v3', 'Rollback'): 'txn',
+    ('datastore_v3', 'AllocateIds'): 'allocate',
+}
+SERVICES = ('datastore_v3', 'memcache', 'taskqueue', 'urlfetch')
+RPC_FIELDS = sorted(set(RPC_TYPES.values())) + \
+    ['datastore', 'memcache', 'taskqueue', 'urlfetch', 'other']
+FIELDS = ['calls', 'errors', 'ms'] + RPC_FIELDS + \
+    ['le_%d' % bound for bound in LATENCY_BUCKETS] + ['le_inf']
+
+# names of the instrumented methods, in the order they were wrapped
+NAMES = []
+
+_local = threading.local()
+_lock = threading.Lock()
+_pending = collections.defaultdict(collections.Counter)
+_pendingCalls = 0
+_lastFlush = time.time()
+
+
+def _rpcType(service, call):
+    """Return the stats field counting a call of a service."""
+    rpcType = RPC_TYPES.get((service, call))
+    if rpcType:
+        return rpcType
+    if service == 'datastore_v3':
+        return 'datastore'
+    return service if service in SERVICES else 'other'
+
+
+def _hook(service, call, request, response):
+    """apiproxy post-call hook counting RPCs made while a method is
+    recorded on this thread."""
+    counts = getattr(_local, 'counts', None)
+    if counts is not None:
+        counts[_rpcType(service, call)] += 1
+
+
+def install():
+    """Add the RPC counting hook to the apiproxy, once per process."""
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('rpcstats', _hook)
+
+
+def _bucket(ms):
+    """Return the histogram field counting a latency in ms."""
+    for bound in LATENCY_BUCKETS:
+        if ms <= bound:
+            return 'le_%d' % bound
+    return 'le_inf'
+
+
+def record(name, func, *args, **kwargs):
+    """Call func, recording its latency and RPCs under name. A call made
+    while another method is recorded on the thread counts towards that
+    method only."""
+    if getattr(_local, 'counts', None) is not None:
+        return func(*args, **kwargs)
+    counts = _local.counts = collections.Counter()
+    start = time.time()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        counts['errors'] += 1
+        raise
+    finally:
+        ms = (time.time() - start) * 1000
+        _local.counts = None
+        counts['calls'] += 1
+        counts['ms'] += int(round(ms))
+        counts[_bucket(ms)] += 1
+        _add(name, counts)
+
+
+def _add(name, counts):
+    """Add a call's counts to the instance totals, flushing them when they
+    are due."""
+    global _pendingCalls
+    with _lock:
+        _pending[name].update(counts)
+        _pendingCalls += 1
+        due = (_pendingCalls >= FLUSH_CALLS or
+               time.time() - _lastFlush >= FLUSH_INTERVAL)
+    if due:
+        flush()
+
+
+def flush():
+    """Add the instance totals to the memcache counters and reset them."""
+    global _pendingCalls, _lastFlush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _pendingCalls = 0
+        _lastFlush = time.time()
+    deltas = dict(('%s:%s' % (name, field), count)
+                  for name, counts in pending.items()
+                  for field, count in counts.items() if count)
+    if deltas:
+        memcache.offset_multi(
+            deltas, key_prefix=MEMCACHE_STATS_KEY, initial_value=0)
+
+
+def _wrap(name, func):
+    """Return func recording its calls under name."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return record(name, func, *args, **kwargs)
+    NAMES.append(name)
+    return wrapper
+
+
+def instrumentService(cls):
+    """Class decorator recording every endpoint method of a protorpc
+    Service under its method name. The wrappers keep the methods' remote
+    info, so dispatch and the API config are unchanged."""
+    for attr, value in cls.__dict__.items():
+        if getattr(value, 'remote', None) is not None:
+            setattr(cls, attr, _wrap(attr, value))
+    return cls
+
+
+def instrumentHandlers(routes):
+    """Record the HTTP methods of webapp2 handlers under the method and
+    path of their route, eg 'GET /changes'. Returns routes."""
+    for path, handler in routes:
+        for verb in ('get', 'post', 'put', 'delete'):
+            method = handler.__dict__.get(verb)
+            if method:
+                setattr(handler, verb, _wrap(
+                    '%s %s' % (verb.upper(), path), method))
+    return routes
+
+
+def statistics():
+    """Return the memcache totals of every instrumented method that was
+    called, busiest first. Percentiles are the upper bound of the
+    histogram bucket they fall in, None past the last bound."""
+    keys = ['%s:%s' % (name, field) for name in NAMES for field in FIELDS]
+    totals = memcache.get_multi(keys, key_prefix=MEMCACHE_STATS_KEY)
+    stats = []
+    for name in NAMES:
+        counts = dict((field, int(totals.get('%s:%s' % (name, field), 0)))
+                      for field in FIELDS)
+        calls = counts['calls']
+        if not calls:
+            continue
+        histogram = [(bound, counts['le_%d' % bound])
+                     for bound in LATENCY_BUCKETS]
+        histogram.append((None, counts['le_inf']))
+        stats.append({
+            'name': name,
+            'calls': calls,
+            'errors': counts['errors'],
+            'totalMs': counts['ms'],
+            'meanMs': round(float(counts['ms']) / calls, 1),
+            'p50Ms': _percentile(histogram, calls, 0.5),
+            'p99Ms': _percentile(histogram, calls, 0.99),
+            'histogram': dict(('le_%s' % (bound or 'inf'), count)
+                              for bound, count in histogram),
+            'rpcsPerCall': dict(
+                (field, round(float(counts[field]) / calls, 2))
+                for field in RPC_FIELDS if counts[field]),
+        })
+    stats.sort(key=lambda s: -s['totalMs'])
+    return stats
+
+
+def _percentile(histogram, calls, fraction):
+    """Return the bucket bound the given fraction of calls falls under."""
+    seen = 0
+    for bound, count in histogram:
+        seen += count
+        if seen >= fraction * calls:
+            return bound
+    return None
+
+
+install()
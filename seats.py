@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""seats.py
+
+Conference server-side Python App Engine sharded seat counters
+
+A sharded Conference keeps its available seats in SEAT_SHARDS root
+SeatShard entities instead of its own seatsAvailable property, so that
+registrations for one conference are spread over several entity groups.
+Conferences created before sharding (seatShards == 0) keep using
+Conference.seatsAvailable until they are sharded.
+
+"""
+
+import random
+
+from google.appengine.ext import ndb
+
+from models import SeatShard
+
+SEAT_SHARDS = 10
+
+
+def shardKeys(c_key, count=SEAT_SHARDS):
+    """Return the SeatShard keys of a conference."""
+    wsck = c_key.urlsafe()
+    return [ndb.Key(SeatShard, '%s:%d' % (wsck, i)) for i in range(count)]
+
+
+def createShards(c_key, seats, count=SEAT_SHARDS):
+    """Return (unsaved) SeatShards splitting seats evenly over count."""
+    base, extra = divmod(max(seats or 0, 0), count)
+    return [SeatShard(key=key, conferenceKey=c_key,
+                      seatsAvailable=base + (1 if i < extra else 0))
+            for i, key in enumerate(shardKeys(c_key, count))]
+
+
+@ndb.tasklet
+def seatsAvailableMultiAsync(confs):
+    """Return a future for a dict of seats available by conference key,
+    reading the shards of all sharded conferences with a single
+    get_multi."""
+    keys = []
+    for conf in confs:
+        if conf.seatShards:
+            keys.extend(shardKeys(conf.key, conf.seatShards))
+    totals = {}
+    shards = yield ndb.get_multi_async(keys)
+    for shard in shards:
+        if shard:
+            totals[shard.conferenceKey] = (
+                totals.get(shard.conferenceKey, 0) + shard.seatsAvailable)
+    raise ndb.Return(dict(
+        (conf.key, totals.get(conf.key, 0) if conf.seatShards
+         else conf.seatsAvailable) for conf in confs))
+
+
+def seatsAvailableMulti(confs):
+    """Return a dict of seats available by conference key."""
+    return seatsAvailableMultiAsync(confs).get_result()
+
+
+def seatsAvailable(conf):
+    """Return the seats available for a single conference."""
+    return seatsAvailableMulti([conf])[conf.key]
+
+
+def openShardKeysMulti(confs):
+    """Return a dict of the keys of each conference's shards that have
+    seats left, in random order so concurrent registrations pick different
+    shards, reading all shards with a single get_multi."""
+    keys = []
+    for conf in confs:
+        keys.extend(shardKeys(conf.key, conf.seatShards))
+    open_keys = dict((conf.key, []) for conf in confs)
+    for shard in ndb.get_multi(keys):
+        if shard and shard.seatsAvailable > 0:
+            open_keys[shard.conferenceKey].append(shard.key)
+    for shard_keys in open_keys.values():
+        random.shuffle(shard_keys)
+    return open_keys
+
+
+def openShardKeys(conf):
+    """Return the keys of the conference's shards that have seats left."""
+    return openShardKeysMulti([conf])[conf.key]
+
+
+def randomShardKey(conf):
+    """Return the key of a random shard of the conference."""
+    return random.choice(shardKeys(conf.key, conf.seatShards))
+
+
+def adjustSeats(conf, delta):
+    """Add delta (possibly negative) seats to the conference's shards;
+    seats are never taken below zero. Must run in a transaction that may
+    touch the shards' entity groups. Returns the modified shards, for the
+    caller to put."""
+    shards = [shard for shard in ndb.get_multi(
+        shardKeys(conf.key, conf.seatShards)) if shard]
+    if delta > 0:
+        shard = random.choice(shards)
+        shard.seatsAvailable += delta
+        return [shard]
+    return _take(shards, -delta)
+
+
+def takeSeats(conf, count):
+    """Take count seats from the conference's shards, all or nothing. Must
+    run in a transaction that may touch the shards' entity groups. Returns
+    the modified shards, for the caller to put, or None if fewer than count
+    seats are left."""
+    shards = [shard for shard in ndb.get_multi(
+        shardKeys(conf.key, conf.seatShards)) if shard]
+    if sum(shard.seatsAvailable for shard in shards) < count:
+        return None
+    return _take(shards, count)
+
+
+def _take(shards, count):
+    """Take up to count seats from shards; returns the modified shards."""
+    changed = []
+    for shard in shards:
+        if count <= 0:
+            break
+        taken = min(shard.seatsAvailable, count)
+        if taken:
+            shard.seatsAvailable -= taken
+            count -= taken
+            changed.append(shard)
+    return changed
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""serializers.py
+
+Conference server-side Python App Engine entity to ProtoRPC form copy plans
+
+Each plan is compiled once at import time from a (Model, Form) pair, so the
+per-field converter is looked up ahead of time instead of being rediscovered
+with hasattr/endswith/setattr reflection for every entity copied.
+
+"""
+
+from models import AttendeeForm
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import ProfileForm
+from models import Session
+from models import SessionForm
+from models import Speaker
+from models import SpeakerForm
+from models import TeeShirtSize
+
+
+class CopyPlan(object):
+    """CopyPlan -- precompiled copy of an ndb entity onto a ProtoRPC form"""
+
+    def __init__(self, model, form, converters=None, extras=None):
+        """Compile the copy steps for model -> form.
+            Args:   model: ndb.Model class to copy from
+                    form: messages.Message class to copy to
+                    converters: dict of field name to function applied to
+                        the entity property value
+                    extras: dict of field name to function(entity, context)
+                        for form fields that are not entity properties; the
+                        field is left unset when the function returns None
+        """
+        converters = converters or {}
+        extras = extras or {}
+        self.form = form
+        self.steps = []
+        for field in form.all_fields():
+            name = field.name
+            if name in extras:
+                self.steps.append((name, extras[name], True))
+            elif name in model._properties:
+                self.steps.append(
+                    (name, _propertyGetter(name, converters.get(name)), False))
+
+    def copy(self, entity, context=None, validate=True):
+        """Copy entity onto a new form.
+            Args:   entity: entity to copy
+                    context: passed through to the extras functions
+                    validate: run check_initialized on the result; trusted
+                        read paths may skip it
+            Returns:    form
+        """
+        form = self.form()
+        for name, getter, optional in self.steps:
+            value = getter(entity, context)
+            if optional and value is None:
+                continue
+            setattr(form, name, value)
+        if validate:
+            form.check_initialized()
+        return form
+
+
+def _propertyGetter(name, converter):
+    """Return a getter for an entity property, applying converter if any."""
+    if converter is None:
+        return lambda entity, context: getattr(entity, name)
+    return lambda entity, context: converter(getattr(entity, name))
+
+
+def _urlsafeOrNone(key):
+    """Return the websafe form of key, or None if there is no key."""
+    if key:
+        return key.urlsafe()
+
+
+def _relatedAttr(keyOf, attr):
+    """Return an extras function reading attr from the related entity
+    found in the context dict under keyOf(entity)."""
+    def getter(entity, related):
+        other = related.get(keyOf(entity))
+        if other:
+            return getattr(other, attr)
+    return getter
+
+
+CONFERENCE_PLAN = CopyPlan(
+    Conference, ConferenceForm,
+    converters={
+        'startDate': str,
+        'endDate': str,
+    },
+    extras={
+        'websafeKey': lambda conf, displayName: conf.key.urlsafe(),
+        'organizerDisplayName': lambda conf, displayName: (
+            displayName or conf.organizerDisplayName or None),
+    })
+
+SESSION_PLAN = CopyPlan(
+    Session, SessionForm,
+    converters={
+        'date': str,
+        'startTime': str,
+        'speakerKey': _urlsafeOrNone,
+    },
+    extras={
+        'websafeKey': lambda sess, related: sess.key.urlsafe(),
+        'conferenceName': _relatedAttr(
+            lambda sess: sess.key.parent(), 'name'),
+        'speakerName': _relatedAttr(
+            lambda sess: sess.speakerKey, 'displayName'),
+    })
+
+PROFILE_PLAN = CopyPlan(
+    Profile, ProfileForm,
+    converters={
+        'teeShirtSize': lambda size: getattr(TeeShirtSize, size),
+    })
+
+ATTENDEE_PLAN = CopyPlan(
+    Profile, AttendeeForm,
+    converters={
+        'teeShirtSize': lambda size: getattr(TeeShirtSize, size),
+    })
+
+SPEAKER_PLAN = CopyPlan(
+    Speaker, SpeakerForm,
+    extras={
+        'websafeKey': lambda speak, context: speak.key.urlsafe(),
+        'creatorUserId': lambda speak, context: speak.key.parent().id(),
+    })
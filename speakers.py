@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""speakers.py
+
+Conference server-side Python App Engine speaker directory
+
+Every Speaker has a SpeakerName entry keyed by its normalized displayName,
+so a speaker name resolves with a strongly consistent get by key instead of
+an eventually consistent displayName query, and no two speakers share a
+name. Type-ahead suggestions for prefixes of up to PREFIX_CACHE_LEN
+characters are cached in memcache, at most SUGGEST_MAX names per prefix,
+tagged with a version counter per prefix. A new speaker bumps the counters
+of its name's prefixes, so a list built from a query that ran before the
+speaker was added is never served, even if it is written afterwards.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Speaker
+from models import SpeakerName
+
+from utils import versionSeed
+
+PREFIX_CACHE_LEN = 3
+SUGGEST_MAX = 10
+PREFIX_CACHE_TTL = 600
+# the datastore's limit on the length of a key name
+NAME_MAX_BYTES = 500
+MEMCACHE_SPEAKER_PREFIX_KEY = u'SPEAKER_PREFIX:%s'
+MEMCACHE_SPEAKER_PREFIX_VERSION_KEY = u'SPEAKER_PREFIX_VERSION:%s'
+
+
+def normalizeName(name):
+    """Return the directory key name for a speaker name: its words in lower
+    case, separated by single spaces."""
+    return u' '.join(name.split()).lower()
+
+
+def validName(name):
+    """Return True if name can be a directory key name: not blank once
+    normalized, and at most NAME_MAX_BYTES bytes."""
+    name = normalizeName(name)
+    return bool(name) and len(name.encode('utf-8')) <= NAME_MAX_BYTES
+
+
+def directoryKey(name):
+    """Return the key of the SpeakerName entry for a speaker name."""
+    return ndb.Key(SpeakerName, normalizeName(name))
+
+
+def directoryEntry(speak):
+    """Return the (unsaved) SpeakerName entry for a Speaker."""
+    return SpeakerName(key=directoryKey(speak.displayName),
+                       speakerKey=speak.key, displayName=speak.displayName)
+
+
+@ndb.tasklet
+def speakersByNameAsync(names):
+    """Return a future for a dict of Speaker entities by name, for the
+    names that resolve, with one get_multi of directory entries and one of
+    speakers. Names missing from the directory, or too long to be in it,
+    fall back to a displayName query, for speakers created before it was
+    backfilled."""
+    names = set(name for name in names if normalizeName(name))
+    valid = [name for name in names if validName(name)]
+    entries = yield ndb.get_multi_async([directoryKey(n) for n in valid])
+    found = [(name, entry.speakerKey)
+             for name, entry in zip(valid, entries) if entry]
+    missing = [name for name, entry in zip(valid, entries) if not entry]
+    missing.extend(name for name in names if not validName(name))
+    # start both lookups before waiting for either
+    speak_futures = ndb.get_multi_async([sp_key for _, sp_key in found])
+    legacy_futures = [Speaker.query(Speaker.displayName == name).get_async()
+                      for name in missing]
+    speakers = yield speak_futures
+    legacy = yield legacy_futures
+    result = dict((name, speak) for (name, _), speak
+                  in zip(found, speakers) if speak)
+    result.update((name, speak) for name, speak
+                  in zip(missing, legacy) if speak)
+    raise ndb.Return(result)
+
+
+def speakersByName(names):
+    """Return a dict of Speaker entities by name."""
+    return speakersByNameAsync(names).get_result()
+
+
+def _prefixKey(prefix):
+    """Return the memcache key of the suggestions for a prefix."""
+    return (MEMCACHE_SPEAKER_PREFIX_KEY % prefix).encode('utf-8')
+
+
+def _versionKey(prefix):
+    """Return the memcache key of the version counter for a prefix."""
+    return (MEMCACHE_SPEAKER_PREFIX_VERSION_KEY % prefix).encode('utf-8')
+
+
+def suggest(prefix):
+    """Return up to SUGGEST_MAX (displayName, websafe speaker key) pairs of
+    directory names starting with prefix, in name order, from a query on
+    the directory keys from prefix on."""
+    prefix = normalizeName(prefix)
+    if not prefix:
+        return []
+    cached = len(prefix) <= PREFIX_CACHE_LEN
+    if cached:
+        # read the version before querying, so a speaker added meanwhile
+        # leaves this list tagged with an outdated version
+        vkey, ckey = _versionKey(prefix), _prefixKey(prefix)
+        found = memcache.get_multi([vkey, ckey])
+        version = found.get(vkey)
+        if version is None:
+            memcache.add(vkey, versionSeed())
+            version = memcache.get(vkey)
+        entry = found.get(ckey)
+        if entry is not None and version is not None and \
+                entry[0] == version:
+            return entry[1]
+    # names starting with prefix sort first from it, so no upper bound key
+    # is needed, which a prefix of NAME_MAX_BYTES would have no room for
+    entries = SpeakerName.query(
+        SpeakerName.key >= ndb.Key(SpeakerName, prefix)).fetch(SUGGEST_MAX)
+    suggestions = [(entry.displayName, entry.speakerKey.urlsafe())
+                   for entry in entries
+                   if entry.key.id().startswith(prefix)]
+    if cached and version is not None:
+        memcache.set(ckey, (version, suggestions), time=PREFIX_CACHE_TTL)
+    return suggestions
+
+
+def forgetPrefixes(name):
+    """Bump the version of every cached prefix of name, so no list cached
+    before, or built from a query run before, is served again."""
+    name = normalizeName(name)
+    memcache.offset_multi(
+        dict((_versionKey(name[:i]), 1)
+             for i in range(1, min(len(name), PREFIX_CACHE_LEN) + 1)),
+        initial_value=versionSeed())
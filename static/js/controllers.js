@@ -293,6 +293,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.conferences = [];
 
+    /**
+     * Holds the cursor returned by queryConferences for fetching the next page,
+     * or null when there are no more results.
+     * @type {string}
+     */
+    $scope.nextWebsafeCursor = null;
+
     /**
      * Holds the state if offcanvas is enabled.
      *
@@ -425,10 +432,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
 
     /**
      * Invokes the conference.queryConferences API.
+     *
+     * @param loadMore if true, appends the next page to the current results.
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (loadMore) {
         var sendFilters = {
-            filters: []
+            filters: [],
+            pageSize: $scope.pagination.pageSize
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -440,6 +450,9 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                 });
             }
         }
+        if (loadMore && $scope.nextWebsafeCursor) {
+            sendFilters.websafeCursor = $scope.nextWebsafeCursor;
+        }
         $scope.loading = true;
         gapi.client.conference.queryConferences(sendFilters).
             execute(function (resp) {
@@ -458,10 +471,17 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!loadMore) {
+                            $scope.conferences = [];
+                            $scope.pagination.currentPage = 0;
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextWebsafeCursor = resp.nextWebsafeCursor || null;
+                        if (loadMore) {
+                            $scope.pagination.currentPage = $scope.pagination.numberOfPages() - 1;
+                        }
                     }
                     $scope.submitted = true;
                 });
@@ -553,11 +573,9 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
     $scope.isUserAttending = false;
 
     /**
-     * Initializes the conference detail page.
      * Invokes the conference.getConference method and sets the returned conference in the $scope.
-     *
      */
-    $scope.init = function () {
+    var getConference = function () {
         $scope.loading = true;
         gapi.client.conference.getConference({
             websafeConferenceKey: $routeParams.websafeConferenceKey
@@ -578,6 +596,53 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                 }
             });
         });
+    };
+
+    /**
+     * True while the page follows the /changes feed, which also carries the user's own registrations.
+     */
+    var followingChanges = false;
+
+    /**
+     * Subscribes to the /changes feed of the conference, so that seat counts are updated as users register.
+     * Browsers without EventSource keep the seats shown when the page was loaded, adjusted for the user's own
+     * registrations.
+     */
+    var subscribeChanges = function () {
+        if (!window.EventSource) {
+            return;
+        }
+        followingChanges = true;
+        var source = new EventSource('/changes?websafeConferenceKey=' +
+            encodeURIComponent($routeParams.websafeConferenceKey));
+        source.addEventListener('seats', function (e) {
+            var change = JSON.parse(e.data);
+            $scope.$apply(function () {
+                // Most events carry the change in seats, those near the threshold the total.
+                if (change.data.delta !== undefined) {
+                    $scope.conference.seatsAvailable += change.data.delta;
+                } else {
+                    $scope.conference.seatsAvailable = change.data.seatsAvailable;
+                }
+            });
+        });
+        // Events were missed, reload the conference.
+        source.addEventListener('reset', function () {
+            getConference();
+        });
+        $scope.$on('$destroy', function () {
+            source.close();
+        });
+    };
+
+    /**
+     * Initializes the conference detail page.
+     * Gets the conference and subscribes to its changes.
+     *
+     */
+    $scope.init = function () {
+        getConference();
+        subscribeChanges();
 
         $scope.loading = true;
         // If the user is attending the conference, updates the status message and available function.
@@ -629,7 +694,10 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         $scope.messages = 'Registered for the conference';
                         $scope.alertStatus = 'success';
                         $scope.isUserAttending = true;
-                        $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
+                        // The change feed reports this seat too.
+                        if (!followingChanges) {
+                            $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
+                        }
                     } else {
                         $scope.messages = 'Failed to register for the conference';
                         $scope.alertStatus = 'warning';
@@ -664,7 +732,10 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         // Unregister succeeded.
                         $scope.messages = 'Unregistered from the conference';
                         $scope.alertStatus = 'success';
-                        $scope.conference.seatsAvailable = $scope.conference.seatsAvailable + 1;
+                        // The change feed reports this seat too.
+                        if (!followingChanges) {
+                            $scope.conference.seatsAvailable = $scope.conference.seatsAvailable + 1;
+                        }
                         $scope.isUserAttending = false;
                         $log.info($scope.messages);
                     } else {
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""textindex_test.py
+
+Tests of the full-text index and the search endpoint on the App Engine
+testbed datastore stub. Run from the repository root with the App Engine
+SDK on the path:
+
+    python -m unittest discover -s tests -p '*_test.py'
+
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+try:
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+except ImportError:
+    pass
+os.environ.setdefault('APPLICATION_ID', 'test')
+
+import endpoints
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from models import Conference
+from models import Posting
+from models import Profile
+
+from conference import ConferenceApi
+from conference import SEARCH_REQUEST
+
+from textindex import indexDocuments
+from textindex import postingKey
+from textindex import search
+
+
+class TextIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bed = testbed.Testbed()
+        self.bed.activate()
+        self.bed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.
+            PseudoRandomHRConsistencyPolicy(probability=1))
+        self.bed.init_memcache_stub()
+        ndb.get_context().set_cache_policy(False)
+        self.p_key = ndb.Key(Profile, 'organizer@example.com')
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def makeConference(self, name, **props):
+        conf = Conference(parent=self.p_key, name=name, **props)
+        conf.put()
+        indexDocuments([conf])
+        return conf
+
+    def testReindexDeletesRemovedTerms(self):
+        conf = self.makeConference('Python Summit')
+        self.assertTrue(postingKey(u'python', conf.key).get())
+
+        conf.name = 'Golang Summit'
+        conf.put()
+        indexDocuments([conf])
+
+        self.assertIsNone(postingKey(u'python', conf.key).get())
+        self.assertEqual(
+            Posting.query(Posting.term == u'python').count(), 0)
+        self.assertEqual(search('python'), ([], 0))
+        results, total = search('golang')
+        self.assertEqual([key for key, _ in results], [conf.key])
+
+    def testMoreMatchedTermsRankFirst(self):
+        # one term, but with far more weight than the other's two
+        heavy = self.makeConference(
+            'Cloud', topics=['Cloud'], description='cloud ' * 200)
+        both = self.makeConference('Cloud Data')
+        self.makeConference('Unrelated')
+
+        results, total = search('cloud data')
+
+        self.assertEqual(total, 2)
+        self.assertEqual([key for key, _ in results], [both.key, heavy.key])
+        scores = dict(results)
+        self.assertGreater(scores[heavy.key], scores[both.key])
+
+    def testPaging(self):
+        for i in range(5):
+            self.makeConference('Summit %d' % i)
+        api = ConferenceApi()
+        request = SEARCH_REQUEST.combined_message_class
+
+        first = api.searchDocuments(request(query='summit', pageSize=2))
+        self.assertEqual(len(first.items), 2)
+        self.assertEqual(first.total, 5)
+        self.assertEqual(first.nextOffset, 2)
+
+        last = api.searchDocuments(
+            request(query='summit', pageSize=2, offset=4))
+        self.assertEqual(len(last.items), 1)
+        self.assertIsNone(last.nextOffset)
+
+        # every document appears on exactly one page
+        keys = [item.websafeKey for offset in (0, 2, 4) for item in
+                api.searchDocuments(request(
+                    query='summit', pageSize=2, offset=offset)).items]
+        self.assertEqual(len(set(keys)), 5)
+
+    def testPagingRejectsBadBounds(self):
+        self.makeConference('Summit')
+        api = ConferenceApi()
+        request = SEARCH_REQUEST.combined_message_class
+
+        for bad in (request(query='summit', pageSize=-1),
+                    request(query='summit', pageSize=101),
+                    request(query='summit', offset=-1)):
+            self.assertRaises(endpoints.BadRequestException,
+                              api.searchDocuments, bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
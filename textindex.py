@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""textindex.py
+
+Conference server-side Python App Engine full-text index
+
+Conferences and sessions are tokenized into terms, and each (term, document)
+pair is stored as a Posting with the term's weight in the document. Each
+Posting is its own root entity, so indexing is never limited by the write
+rate of an entity group; a term's posting list is read with one eventually
+consistent query on term, ordered by weight, so a document may show up in
+searches a moment after it is indexed. Each document's DocTerms lists the
+terms it was indexed under, so re-indexing removes the postings of terms
+it no longer contains.
+
+Only ndb is used, so the index also runs on the testbed datastore stub.
+
+"""
+
+import collections
+import math
+import re
+
+from google.appengine.ext import ndb
+
+from models import DocTerms
+from models import Posting
+
+MAX_TERM_LEN = 64
+MAX_QUERY_TERMS = 8
+TERM_FETCH_MAX = 200
+SEARCH_MAX_RESULTS = 200
+
+STOPWORDS = frozenset((
+    'a an and are as at be by for from in is it of on or that the this to '
+    'with').split())
+
+# weight of one occurrence of a term in each indexed field
+FIELDS = {
+    'Conference': (('name', 3.0), ('topics', 2.0), ('city', 1.0),
+                   ('description', 1.0)),
+    'Session': (('name', 3.0), ('typeOfSession', 1.0), ('highlights', 1.0)),
+}
+SPEAKER_WEIGHT = 2.0
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Return the index terms of text, in order and with repeats."""
+    return [term for term in _TOKEN_RE.findall(text.lower())
+            if 1 < len(term) <= MAX_TERM_LEN and term not in STOPWORDS]
+
+
+def documentTerms(doc, speaker=None):
+    """Return a dict of term weights for a Conference, or for a Session and
+    its Speaker. Repeated terms add up with diminishing returns."""
+    fields = [(getattr(doc, name), weight)
+              for name, weight in FIELDS[doc._get_kind()]]
+    if speaker:
+        fields.append((speaker.displayName, SPEAKER_WEIGHT))
+    weights = collections.defaultdict(float)
+    for value, weight in fields:
+        for text in (value if isinstance(value, list) else [value]):
+            if text:
+                for term in tokenize(text):
+                    weights[term] += weight
+    return dict((term, round(math.log(1.0 + weight), 4))
+                for term, weight in weights.items())
+
+
+def postingKey(term, doc_key):
+    """Return the key of the Posting of a term in a document."""
+    return ndb.Key(Posting, u'%s %s' % (term, doc_key.urlsafe()))
+
+
+def indexDocuments(docs, speakers=None):
+    """(Re)index Conferences and Sessions, writing all their postings with
+    one put_multi and deleting the postings of terms they lost.
+        Args:   docs: Conference and Session entities
+                speakers: dict of Speaker entities by key, for the names of
+                    the sessions' speakers
+    """
+    speakers = speakers or {}
+    entries = ndb.get_multi(
+        [ndb.Key(DocTerms, doc.key.urlsafe()) for doc in docs])
+    puts, deletes = [], []
+    for doc, entry in zip(docs, entries):
+        terms = documentTerms(
+            doc, speakers.get(getattr(doc, 'speakerKey', None)))
+        kind = doc._get_kind()
+        puts.extend(Posting(key=postingKey(term, doc.key), term=term,
+                            kind=kind, docKey=doc.key, weight=weight)
+                    for term, weight in terms.items())
+        if entry:
+            deletes.extend(postingKey(term, doc.key)
+                           for term in set(entry.terms) - set(terms))
+        puts.append(DocTerms(key=ndb.Key(DocTerms, doc.key.urlsafe()),
+                             terms=sorted(terms)))
+    ndb.put_multi(puts)
+    ndb.delete_multi(deletes)
+
+
+def search(query, kind=None, offset=0, limit=20):
+    """Rank the documents matching any term of query, optionally only of
+    one kind. Documents matching more query terms rank first, then those
+    with the higher sum of term weights, each scaled by how rare the term
+    is among the TERM_FETCH_MAX best postings read for it.
+        Returns:    ([(document key, score)] for the page, total ranked)
+    """
+    terms = []
+    for term in tokenize(query):
+        if term not in terms:
+            terms.append(term)
+    terms = terms[:MAX_QUERY_TERMS]
+
+    # read the best postings of every term concurrently
+    futures = []
+    for term in terms:
+        q = Posting.query(Posting.term == term)
+        if kind:
+            q = q.filter(Posting.kind == kind)
+        futures.append(q.order(-Posting.weight).fetch_async(TERM_FETCH_MAX))
+
+    scores = collections.defaultdict(float)
+    matched = collections.defaultdict(int)
+    for future in futures:
+        postings = future.get_result()
+        if not postings:
+            continue
+        idf = math.log(1.0 + float(TERM_FETCH_MAX) / len(postings))
+        for posting in postings:
+            scores[posting.docKey] += posting.weight * idf
+            matched[posting.docKey] += 1
+
+    ranked = sorted(scores, key=lambda key: (
+        -matched[key], -scores[key], key.urlsafe()))[:SEARCH_MAX_RESULTS]
+    return ([(key, scores[key]) for key in ranked[offset:offset + limit]],
+            len(ranked))
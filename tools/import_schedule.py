@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""import_schedule.py
+
+Replay a conference schedule from a CSV or JSON file against the
+conference API importSessions endpoint.
+
+CSV files need a header row naming SessionForm fields; JSON files hold a
+list of objects with the same keys:
+
+    name, highlights, speakerName, typeOfSession, duration, date, startTime
+
+date is %Y-%m-%d and startTime is 24 hour %H:%M. The OAuth access token of
+the conference organizer is read from --token or $CONFERENCE_TOKEN.
+
+    python tools/import_schedule.py --conference WEBSAFE_KEY schedule.csv
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import urllib2
+
+IMPORT_MAX_SESSIONS = 500
+FIELDS = ('name', 'highlights', 'speakerName', 'typeOfSession', 'duration',
+          'date', 'startTime')
+REQUIRED = ('name', 'date', 'startTime')
+API_PATH = '/_ah/api/conference/v1/conference/%s/session/import'
+
+
+def readSchedule(path):
+    """Return the sessions in a CSV or JSON schedule file as dicts."""
+    with open(path) as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    sessions = []
+    for line, row in enumerate(rows, 1):
+        sess = dict((k, row[k]) for k in FIELDS if row.get(k) not in
+                    (None, ''))
+        missing = [k for k in REQUIRED if k not in sess]
+        if missing:
+            raise ValueError('session %d is missing %s' % (
+                line, ', '.join(missing)))
+        if 'duration' in sess:
+            sess['duration'] = int(sess['duration'])
+        sessions.append(sess)
+    return sessions
+
+
+def importSessions(host, token, websafeConferenceKey, sessions):
+    """POST sessions to importSessions, IMPORT_MAX_SESSIONS per request;
+    returns the number of sessions created."""
+    url = 'https://%s%s' % (host, API_PATH % websafeConferenceKey)
+    created = 0
+    for i in range(0, len(sessions), IMPORT_MAX_SESSIONS):
+        body = json.dumps({'items': sessions[i:i + IMPORT_MAX_SESSIONS]})
+        req = urllib2.Request(url, body, {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer %s' % token,
+        })
+        resp = json.load(urllib2.urlopen(req))
+        created += len(resp.get('items', []))
+    return created
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('schedule', help='CSV or JSON schedule file')
+    parser.add_argument('--conference', required=True,
+                        help='websafe key of the conference')
+    parser.add_argument('--host', default='conferencegqw.appspot.com')
+    parser.add_argument('--token', default=os.getenv('CONFERENCE_TOKEN'))
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error('--token or $CONFERENCE_TOKEN required')
+
+    sessions = readSchedule(args.schedule)
+    created = importSessions(args.host, args.token, args.conference,
+                             sessions)
+    print 'Imported %d of %d sessions.' % (created, len(sessions))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
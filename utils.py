@@ -1,11 +1,23 @@
+import hashlib
 import json
 import os
 import time
 import uuid
 
+from google.appengine.api import memcache
 from google.appengine.api import urlfetch
 from models import Profile
 
+MEMCACHE_TOKENINFO_KEY = 'TOKENINFO:%s'
+TOKENINFO_TTL = 300
+
+def versionSeed():
+    """Return a starting value for a memcache version counter. It is time
+    based, so a counter evicted from memcache restarts above the versions
+    it handed out before."""
+    return int(time.time() * 1000)
+
+
 def getUserId(user, id_type="email"):
     if id_type == "email":
         return user.email()
@@ -14,6 +26,12 @@ def getUserId(user, id_type="email"):
         """A workaround implementation for getting userid."""
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
+        # tokeninfo results are cached by a hash of the token, never the
+        # token itself, for at most TOKENINFO_TTL seconds
+        mkey = MEMCACHE_TOKENINFO_KEY % hashlib.sha256(token).hexdigest()
+        user_id = memcache.get(mkey)
+        if user_id:
+            return user_id
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
@@ -32,7 +50,12 @@ def getUserId(user, id_type="email"):
             else:
                 time.sleep(wait)
                 wait = wait + i
-        return user.get('user_id', '')
+        user_id = user.get('user_id', '')
+        # keep it no longer than the token is valid
+        ttl = min(TOKENINFO_TTL, int(user.get('expires_in', TOKENINFO_TTL)))
+        if user_id and ttl > 0:
+            memcache.set(mkey, user_id, time=ttl)
+        return user_id
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm